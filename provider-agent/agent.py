@@ -3,17 +3,20 @@
 Upgraded Provider Node Agent
 - polls backend for jobs
 - fetches renter script + requirements
-- generates Dockerfile per-job
-- builds and runs container
+- runs each job in a prebuilt base image with its files bind-mounted
+  (requirements are installed once per distinct requirements.txt and reused)
 - streams logs + usage to backend
 - computes model hash and posts job finish
 
 Usage:
-    pip install requests psutil
+    pip install requests psutil orjson
+    pip install blake3   # optional: faster, multi-threaded model hashing
+    pip install docker   # optional: run containers / stream logs via the Docker daemon API
     export BACKEND_URL="http://127.0.0.1:8000"
     python agent.py
 """
 import os
+import sys
 import uuid
 import time
 import json
@@ -22,47 +25,82 @@ import platform
 import secrets
 import hashlib
 import hmac
+import mmap
+import orjson
+import shutil
+import ssl
 import subprocess
 import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import deque
 from pathlib import Path
-from datetime import datetime
+
+try:
+    import blake3  # optional: SIMD + multi-threaded hashing, much faster than SHA-256 on big models
+except ImportError:
+    blake3 = None
+
+try:
+    import docker  # optional: Docker SDK, streams container logs straight from the daemon socket
+except ImportError:
+    docker = None
 
 # ---------- CONFIG ----------
 BACKEND_URL = os.environ.get("BACKEND_URL", "http://127.0.0.1:8000")
 NODE_ID = str(uuid.uuid4())
 HANDSHAKE_KEY = secrets.token_hex(16)
 APTOS_PUBLIC_KEY = os.environ.get("APTOS_PUBLIC_KEY", "")  # Node owner's Aptos wallet address
-POLL_INTERVAL = 5            # seconds for job polling
-HEARTBEAT_INTERVAL = 10      # seconds
+POLL_INTERVAL = 5            # seconds to back off after a failed or non-long-poll job poll
+POLL_BACKOFF_MAX = 60        # back-off doubles per consecutive failed poll, up to this
+LONG_POLL_WAIT = 25          # seconds the backend may hold /api/jobs/poll open waiting for a job
+LOCAL_QUEUE_SIZE = int(os.environ.get("AGENT_LOCAL_QUEUE_SIZE", "1"))  # jobs claimed per poll, run in order
+HEARTBEAT_INTERVAL = 10      # seconds between telemetry posts while idle
+USAGE_REPORT_INTERVAL = 5    # seconds between telemetry posts while a job runs
 JOB_WORKDIR = Path("./workspace/jobs")
 JOB_WORKDIR.mkdir(parents=True, exist_ok=True)
+DOCKER_BIN = shutil.which("docker")  # resolved once; absolute path reused for every docker invocation
 TRAINER_IMAGE_PREFIX = "shelbycompute-trainer"
+# base trainer image; job files are bind-mounted at /workspace when the job runs
+BASE_DOCKERFILE = """FROM python:3.10-slim
+WORKDIR /workspace
+CMD ["python", "train.py"]
+"""
+# tagged by Dockerfile content, so an unchanged image is never rebuilt
+TRAINER_BASE_IMAGE = f"{TRAINER_IMAGE_PREFIX}:base-{hashlib.sha256(BASE_DOCKERFILE.encode()).hexdigest()[:12]}"
+BASE_IMAGE_DIR = Path("./workspace/base-image")
+DEPS_DIR = Path("./workspace/deps")            # pip --target dirs keyed by requirements hash
+PIP_CACHE_DIR = Path("./workspace/pip-cache")  # shared wheel cache mounted into installs
+LOG_FLUSH_INTERVAL = 0.05    # seconds between stream-log batch flushes
+LOG_FLUSH_BYTES = 64 * 1024  # flush early once this many bytes are buffered
+CONTAINER_READ_CHUNK = 64 * 1024    # bytes per read() on the container stdout pipe
+CONTAINER_PIPE_SIZE = 1024 * 1024   # kernel pipe buffer for container stdout (Python 3.10+)
+PREFERRED_MODEL_NAMES = ("model.bin", "pytorch_model.bin", "model.pt", "model.pth")
+HASH_CHUNK_SIZE = 4 * 1024 * 1024   # read size when hashing model files without hashlib.file_digest
+MMAP_HASH_MAX_BYTES = psutil.virtual_memory().total  # bigger files are hashed with streamed reads
+MODEL_HASH_ALGO = "blake3" if blake3 is not None else "sha256"
 DATABASE_URL = os.environ.get("DATABASE_URL", "")
 # ----------------------------
 # ----------------- Utility functions ----------------- 
 def now_ts():
     return int(time.time())
 
+# host facts that never change while the agent runs (platform.* can shell out on some OSes)
+_STATIC_SPECS = {
+    "totalRAM_GB": round(psutil.virtual_memory().total / (1024**3), 2),
+    "os": platform.system(),
+    "platform": platform.platform(),
+    "processor": platform.processor(),
+}
+
 def get_system_specs():
     cpu = psutil.cpu_percent(interval=1)
-    ram = psutil.virtual_memory().percent   
-    total_ram = round(psutil.virtual_memory().total / (1024**3), 2)
-    return {
-        "cpuUsage": cpu,
-        "ramUsage": ram,
-        "totalRAM_GB": total_ram,
-        "os": platform.system(),
-        "platform": platform.platform(),
-        "processor": platform.processor(),
-    }
+    ram = psutil.virtual_memory().percent
+    return {"cpuUsage": cpu, "ramUsage": ram, **_STATIC_SPECS}
 
 def check_docker_installed():
-    try:
-        subprocess.run(["docker", "--version"], capture_output=True, check=True)
-        return True
-    except Exception:
-        return False
+    return DOCKER_BIN is not None
 
 def sign_job_result(job_id, secret_key):
     message = f"{job_id}".encode()
@@ -70,10 +108,24 @@ def sign_job_result(job_id, secret_key):
     return signature
 
 # ----------------- Backend helpers -----------------
+# one pooled keep-alive session shared by heartbeat, polling, log and usage threads
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16,
+                       max_retries=Retry(total=2, backoff_factor=0.1))
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+# a poll claims jobs server-side, so a retried read timeout would claim a second batch;
+# the poll loop handles failures itself (the longest matching mount prefix wins)
+SESSION.mount(f"{BACKEND_URL}/api/jobs/poll", HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0))
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
 def backend_post(path, json_payload=None, params=None, timeout=10):
     url = f"{BACKEND_URL}{path}"
     try:
-        r = requests.post(url, json=json_payload, params=params, timeout=timeout)
+        # encode with orjson instead of requests' stdlib json encoder
+        data = orjson.dumps(json_payload) if json_payload is not None else None
+        r = SESSION.post(url, data=data, headers=JSON_HEADERS, params=params, timeout=timeout)
         r.raise_for_status()
         return r
     except Exception as e:
@@ -83,7 +135,7 @@ def backend_post(path, json_payload=None, params=None, timeout=10):
 def backend_get(path, params=None, timeout=10):
     url = f"{BACKEND_URL}{path}"
     try:
-        r = requests.get(url, params=params, timeout=timeout)
+        r = SESSION.get(url, params=params, timeout=timeout)
         r.raise_for_status()
         return r
     except Exception as e:
@@ -112,15 +164,35 @@ def register_node(node_id, specs, secret_key, aptos_public_key=None):
     print(f"Response: {res.text if res else 'No response'}")
     return False
 
-def start_heartbeat(node_id):
+# job whose container is currently running, reported with each telemetry sample
+current_job_id = None
+job_started = threading.Event()
+
+def start_telemetry(node_id):
+    """
+    Single periodic post carrying the heartbeat plus a CPU/RAM sample (and the running job, if any).
+    We'll measure host usage snapshot as approximate.
+    """
+    # prime the sampler; later non-blocking reads cover the time since the previous call
+    psutil.cpu_percent(interval=None)
     while True:
+        job_started.clear()
+        job_id = current_job_id
         try:
-            backend_post("/api/nodes/heartbeat", json_payload={"nodeId": node_id})
+            payload = {
+                "nodeId": node_id,
+                "jobId": job_id,
+                "cpu": psutil.cpu_percent(interval=None),
+                "ram": psutil.virtual_memory().percent,
+                "ts": now_ts()
+            }
+            backend_post("/api/nodes/telemetry", json_payload=payload)
             # debug output
             print("Heartbeat 💓 sent")
         except Exception as e:
-            print("Heartbeat exception:", e)
-        time.sleep(HEARTBEAT_INTERVAL)
+            print("Telemetry exception:", e)
+        # wake early when a job starts so its first sample isn't a full idle interval away
+        job_started.wait(USAGE_REPORT_INTERVAL if job_id else HEARTBEAT_INTERVAL)
 
 # ----------------- Job handling -----------------
 def fetch_script_for_job(job_id):
@@ -148,126 +220,283 @@ def save_job_files(job_id, script_text=None, requirements_text=None):
         (job_dir / "requirements.txt").write_text(requirements_text, encoding="utf-8")
     return job_dir
 
-def generate_dockerfile(job_dir: Path):
-    # simple Dockerfile that copies everything and runs train.py
-    df = f"""FROM python:3.10-slim
-WORKDIR /workspace
-COPY . /workspace
-# attempt to install requirements if present; ignore failures
-RUN if [ -f requirements.txt ]; then pip install --no-cache-dir -r requirements.txt || true; fi
-CMD ["python", "train.py"]
-"""
-    (job_dir / "Dockerfile").write_text(df, encoding="utf-8")
-
-def build_image(job_id: str, job_dir: Path):
-    tag = f"{TRAINER_IMAGE_PREFIX}-{job_id.lower()}"
-    # build command
-    cmd = ["docker", "build", "-t", tag, "."]
-    print("Building docker image:", " ".join(cmd), "in", str(job_dir))
-    p = subprocess.run(cmd, cwd=str(job_dir), capture_output=True, text=True)
+def generate_dockerfile(image_dir: Path):
+    image_dir.mkdir(parents=True, exist_ok=True)
+    (image_dir / "Dockerfile").write_text(BASE_DOCKERFILE, encoding="utf-8")
+
+def docker_image_exists(tag):
+    p = subprocess.run([DOCKER_BIN, "image", "inspect", tag], capture_output=True)
+    return p.returncode == 0
+
+def build_base_image():
+    """Build the shared trainer base image once (at agent startup) instead of per job"""
+    if docker_image_exists(TRAINER_BASE_IMAGE):
+        print("Docker image up to date:", TRAINER_BASE_IMAGE)
+        return TRAINER_BASE_IMAGE
+    generate_dockerfile(BASE_IMAGE_DIR)
+    cmd = [DOCKER_BIN, "build", "-t", TRAINER_BASE_IMAGE, "."]
+    print("Building docker image:", " ".join(cmd), "in", str(BASE_IMAGE_DIR))
+    env = dict(os.environ, DOCKER_BUILDKIT="1")
+    p = subprocess.run(cmd, cwd=str(BASE_IMAGE_DIR), capture_output=True, text=True, env=env)
     if p.returncode != 0:
         print("Docker build failed:", p.stderr)
         return None
-    print("Docker image built:", tag)
-    return tag
+    print("Docker image built:", TRAINER_BASE_IMAGE)
+    return TRAINER_BASE_IMAGE
+
+def ensure_job_deps(job_dir: Path):
+    """
+    Install the job's requirements.txt into a directory keyed by its content hash, so a
+    requirement set is pip-installed once and reused by every later job that asks for it.
+    Returns the deps dir to mount (or None when the job has no requirements).
+    """
+    req_file = job_dir / "requirements.txt"
+    if not req_file.exists():
+        return None
+    requirements = req_file.read_bytes()
+    if not requirements.strip():
+        return None
+    # keyed by base image too: packages installed for one Python version aren't reused on another
+    deps_dir = DEPS_DIR / hashlib.sha256(TRAINER_BASE_IMAGE.encode() + requirements).hexdigest()[:16]
+    marker = deps_dir / ".installed"
+    if marker.exists():
+        print("Reusing installed requirements:", deps_dir.name)
+        return deps_dir
+    deps_dir.mkdir(parents=True, exist_ok=True)
+    PIP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cmd = [
+        DOCKER_BIN, "run", "--rm",
+        "-v", f"{str(deps_dir.resolve())}:/deps",
+        "-v", f"{str(req_file.resolve())}:/tmp/requirements.txt:ro",
+        "-v", f"{str(PIP_CACHE_DIR.resolve())}:/root/.cache/pip",
+        TRAINER_BASE_IMAGE,
+        "pip", "install", "--target", "/deps", "-r", "/tmp/requirements.txt"
+    ]
+    print("Installing requirements:", deps_dir.name)
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    if p.returncode != 0:
+        # same policy as before: a failed install doesn't abort the job
+        print("Requirements install failed (continuing):", p.stderr)
+    else:
+        marker.touch()
+    return deps_dir
 
-def stream_container_logs(container_proc, job_id):
+class LogBatcher:
     """
-    container_proc is a Popen subprocess started with stdout=PIPE
-    stream lines to backend
+    Buffers container output lines for a job and ships them to the backend
+    in batches (one POST per flush instead of one per line).
+    Flushes every LOG_FLUSH_INTERVAL seconds, or early once LOG_FLUSH_BYTES are buffered.
     """
-    for raw in iter(container_proc.stdout.readline, ""):
-        if raw is None:
-            break
-        line = raw.rstrip("\n")
+    def __init__(self, job_id, flush_interval=LOG_FLUSH_INTERVAL, max_bytes=LOG_FLUSH_BYTES):
+        self.job_id = job_id
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self._lines = deque()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, line):
+        with self._lock:
+            self._lines.append(line)
+            self._size += len(line)
+            full = self._size >= self.max_bytes
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            if not self._lines:
+                return
+            lines = list(self._lines)
+            self._lines.clear()
+            self._size = 0
+        backend_post("/api/jobs/stream-log-batch", json_payload={"job_id": self.job_id, "lines": lines})
+
+    def close(self):
+        # stop the flusher and ship whatever is still buffered
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("log batch flush err:", e)
+
+def _emit_container_lines(text, batcher):
+    for line in text.split("\n"):
+        line = line.rstrip("\r")
         if not line:
             continue
         # print locally
         print(f"[container] {line}")
-        # send to backend stream-log endpoint
-        try:
-            # POST /api/jobs/stream-log?job_id=<>&line=<>
-            # using form or params: using JSON body
-            backend_post("/api/jobs/stream-log", json_payload={"job_id": job_id, "line": line})
-        except Exception:
-            pass
+        batcher.append(line)
 
-def monitor_usage_while(container_pid, node_id, job_id, stop_event):
+def stream_container_logs(chunks, job_id):
     """
-    Periodically send CPU/RAM usage while container is running.
-    We'll measure host usage snapshot as approximate.
+    chunks is an iterable of raw container output bytes (docker SDK log stream or pipe reads)
+    decode whole lines at once and stream them to backend in batches
     """
-    try:
-        while not stop_event.is_set():
-            cpu = psutil.cpu_percent(interval=1)
-            ram = psutil.virtual_memory().percent
-            payload = {
-                "nodeId": node_id,
-                "jobId": job_id,
-                "cpu_percent": cpu,
-                "ram_percent": ram,
-                "ts": now_ts()
-            }
-            backend_post("/api/usage-report", json_payload=payload)
-            # sleep small interval (we already had 1 sec in cpu_percent)
-            time.sleep(4)
-    except Exception as e:
-        print("usage monitor err:", e)
+    pending = b""
+    with LogBatcher(job_id) as batcher:
+        for chunk in chunks:
+            data = pending + chunk
+            cut = data.rfind(b"\n")
+            if cut < 0:
+                pending = data
+                continue
+            pending = data[cut + 1:]
+            _emit_container_lines(data[:cut].decode("utf-8", "replace"), batcher)
+        if pending:
+            _emit_container_lines(pending.decode("utf-8", "replace"), batcher)
 
 def compute_sha256(path: Path) -> str:
-    h = hashlib.sha256()
+    # hashlib is backed by OpenSSL (>= 1.1.1 uses SHA-NI / ARMv8 SHA2 instructions when the CPU has them)
     with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024*1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+        size = os.fstat(f.fileno()).st_size
+        if 0 < size <= MMAP_HASH_MAX_BYTES:
+            # one update() over an mmap: a single pass over the page cache, no Python-level chunk loop
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                return hashlib.sha256(mm).hexdigest()
+        # larger than RAM (or empty): stream it sequentially
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        h = hashlib.sha256()
+        buf = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+        return h.hexdigest()
 
-def run_job_container(image_tag: str, job_dir: Path, job_id: str, node_id: str, timeout_minutes: int = 20):
-    output_dir = job_dir / "output"
-    output_dir.mkdir(exist_ok=True)
-    # run docker container and capture stdout
+def cpu_has_sha_extensions():
+    """True/False from the CPU flags (x86 sha_ni, ARM sha2); None when they can't be read"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read().split()
+    except OSError:
+        return None
+    return "sha_ni" in flags or "sha2" in flags
+
+def compute_content_hash(path: Path) -> str:
+    """Content fingerprint of a model file using MODEL_HASH_ALGO (blake3 when installed, else sha256)"""
+    if blake3 is not None:
+        return blake3.blake3(max_threads=blake3.blake3.AUTO).update_mmap(path).hexdigest()
+    return compute_sha256(path)
+
+_docker_client = None
+
+def get_docker_client():
+    """Docker SDK client (created once), or None to fall back to the docker CLI"""
+    global _docker_client
+    if _docker_client is None and docker is not None:
+        try:
+            _docker_client = docker.from_env()
+        except Exception as e:
+            print("Docker SDK unavailable, using docker CLI:", e)
+            _docker_client = False
+    return _docker_client or None
+
+def run_container_sdk(client, job_dir: Path, job_id: str, deps_dir: Path = None):
+    volumes = {str(job_dir.resolve()): {"bind": "/workspace", "mode": "rw"}}
+    environment = {}
+    if deps_dir is not None:
+        volumes[str(deps_dir.resolve())] = {"bind": "/deps", "mode": "ro"}
+        environment["PYTHONPATH"] = "/deps"
+    print("Running container (docker SDK):", TRAINER_BASE_IMAGE)
+    container = client.containers.run(TRAINER_BASE_IMAGE, volumes=volumes, environment=environment, detach=True)
+    try:
+        # stream logs to backend in batches, in the chunks the daemon sends them
+        try:
+            stream_container_logs(container.logs(stream=True, follow=True), job_id)
+        except Exception as e:
+            print("Error streaming container logs:", e)
+        return container.wait()["StatusCode"]
+    finally:
+        container.remove(force=True)
+
+def run_container_cli(job_dir: Path, job_id: str, deps_dir: Path = None):
+    # run docker container with the job dir mounted as its workspace and capture stdout
     cmd = [
-        "docker", "run", "--rm",
-        "-v", f"{str(output_dir.resolve())}:/workspace/output",
-        image_tag
+        DOCKER_BIN, "run", "--rm",
+        "-v", f"{str(job_dir.resolve())}:/workspace",
     ]
+    if deps_dir is not None:
+        cmd += ["-v", f"{str(deps_dir.resolve())}:/deps:ro", "-e", "PYTHONPATH=/deps"]
+    cmd.append(TRAINER_BASE_IMAGE)
     print("Running container:", " ".join(cmd))
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-    stop_event = threading.Event()
-    # start usage monitor thread
-    usage_thread = threading.Thread(target=monitor_usage_while, args=(proc.pid, node_id, job_id, stop_event))
-    usage_thread.daemon = True
-    usage_thread.start()
-    # stream logs line-by-line to backend
+    popen_kwargs = {}
+    if sys.version_info >= (3, 10):
+        # bigger kernel pipe so docker never blocks on a slow reader (ignored where unsupported)
+        popen_kwargs["pipesize"] = CONTAINER_PIPE_SIZE
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=-1, **popen_kwargs)
+    # stream logs to backend in batches
     try:
-        for raw in iter(proc.stdout.readline, ""):
-            if raw is None:
-                break
-            line = raw.rstrip("\n")
-            if line:
-                print("[container]", line)
-                backend_post("/api/jobs/stream-log", json_payload={"job_id": job_id, "line": line})
+        stream_container_logs(iter(lambda: proc.stdout.read1(CONTAINER_READ_CHUNK), b""), job_id)
     except Exception as e:
         print("Error streaming container logs:", e)
     finally:
         proc.wait()
-        stop_event.set()
-        usage_thread.join(timeout=2)
-    rc = proc.returncode
+    return proc.returncode
+
+def find_model_file(output_dir: Path):
+    # prefer model.bin or *.pth/*.pt/*.bin - one stat per name instead of listing the whole dir
+    for name in PREFERRED_MODEL_NAMES:
+        p = output_dir / name
+        if p.is_file():
+            return p
+    # fall back to the largest file; scandir entries cache their stat results
+    largest = None
+    with os.scandir(output_dir) as it:
+        for entry in it:
+            if not entry.is_file():
+                continue
+            if largest is None or entry.stat().st_size > largest.stat().st_size:
+                largest = entry
+    return Path(largest.path) if largest else None
+
+def run_job_container(job_dir: Path, job_id: str, node_id: str, deps_dir: Path = None, timeout_minutes: int = 20):
+    output_dir = job_dir / "output"
+    output_dir.mkdir(exist_ok=True)
+    global current_job_id
+    current_job_id = job_id
+    job_started.set()
+    try:
+        client = get_docker_client()
+        if client is not None:
+            rc = run_container_sdk(client, job_dir, job_id, deps_dir)
+        else:
+            rc = run_container_cli(job_dir, job_id, deps_dir)
+    finally:
+        current_job_id = None
     print("Container finished with rc:", rc)
-    # look for model file in output directory (heuristic: largest file, or model.bin)
-    model_file = None
-    candidates = list(output_dir.glob("*"))
-    if not candidates:
+    # look for model file in output directory (heuristic: model.bin & friends, else largest file)
+    model_file = find_model_file(output_dir)
+    if model_file is None:
         print("No output files found in output/ - job may not have produced model.")
         return None, None, rc
-    # prefer model.bin or *.pth/*.pt/*.bin
-    preferred = None
-    for p in candidates:
-        if p.name.lower() in ("model.bin", "pytorch_model.bin", "model.pt", "model.pth"):
-            preferred = p
-            break
-    model_file = preferred or max(candidates, key=lambda p: p.stat().st_size)
-    model_hash = compute_sha256(model_file)
+    model_hash = compute_content_hash(model_file)
     model_size = model_file.stat().st_size
     return str(model_file.resolve()), model_hash, model_size
 
@@ -276,6 +505,7 @@ def finish_job_report(node_id, job_id, model_hash, model_size, duration_seconds,
         "nodeId": node_id,
         "jobId": job_id,
         "modelHash": model_hash,
+        "modelHashAlgo": MODEL_HASH_ALGO,
         "modelSizeBytes": model_size,
         "metadata": metadata or {},
         "durationSeconds": duration_seconds
@@ -287,6 +517,16 @@ def finish_job_report(node_id, job_id, model_hash, model_size, duration_seconds,
         print("Finish report failed ❌")
 
 # ----------------- High-level job handler -----------------
+# tiny demo training script used when a job has a datasetUrl but no uploaded script
+FALLBACK_TRAIN_SCRIPT = '''\
+import time, json, os
+out = "output/model.bin"
+os.makedirs("output", exist_ok=True)
+with open(out, "wb") as f:
+    f.write(b"demo-model-" + b"{job_id}".replace(b"-", b""))
+print("Fallback training: wrote demo model to", out)
+'''
+
 def handle_job(job: dict, node_id: str, secret_key: str):
     job_id = job.get("jobId")
     datasetName = job.get("datasetName") or job.get("dataset")
@@ -322,31 +562,19 @@ def handle_job(job: dict, node_id: str, secret_key: str):
         if datasetUrl and not (job_dir / "train.py").exists():
             # generate minimal train.py that just writes a tiny model (if user didn't upload script)
             print("Generating fallback train.py (tiny demo training) — replace with real script for production")
-            fallback = f'''\
-import time, json, os
-out = "output/model.bin"
-os.makedirs("output", exist_ok=True)
-with open(out, "wb") as f:
-    f.write(b"demo-model-" + b"{job_id}".replace(b"-", b""))
-print("Fallback training: wrote demo model to", out)
-'''
-            save_job_files(job_id, script_text=fallback, requirements_text="")
+            save_job_files(job_id, script_text=FALLBACK_TRAIN_SCRIPT.format(job_id=job_id), requirements_text="")
         elif (job_dir / "train.py").exists():
             print("Found existing train.py locally; using it.")
         else:
             print("No script available for job; aborting.")
             return
 
-    # generate Dockerfile and build
-    generate_dockerfile(job_dir)
-    image_tag = build_image(job_id, job_dir)
-    if not image_tag:
-        print("Image build failed; aborting job.")
-        return
+    # install requirements (cached per requirements hash); no per-job image build
+    deps_dir = ensure_job_deps(job_dir)
 
     # run container and stream logs; measure duration
     start = time.time()
-    model_path, model_hash, model_size = run_job_container(image_tag, job_dir, job_id, node_id)
+    model_path, model_hash, model_size = run_job_container(job_dir, job_id, node_id, deps_dir)
     duration = int(time.time() - start)
     if model_hash:
         print(f"Model saved at {model_path} size={model_size} hash={model_hash}")
@@ -359,22 +587,46 @@ print("Fallback training: wrote demo model to", out)
 
 # ----------------- Poll loop -----------------
 def poll_for_job_loop(node_id, secret_key):
+    # jobs already claimed for this node by an earlier poll (localQueueSize > 1)
+    local_queue = deque()
+    failures = 0
     while True:
+        if local_queue:
+            job = local_queue.popleft()
+            try:
+                # handle job synchronously (blocking) - this is fine for single node
+                handle_job(job, node_id, secret_key)
+            except Exception as e:
+                # one broken job must not kill the agent (and strand the rest of local_queue)
+                print("Job failed ❌:", e)
+                finish_job_report(node_id, job.get("jobId"), "", 0, duration_seconds=0,
+                                  metadata={"error": f"{type(e).__name__}: {e}"})
+            continue
         try:
-            res = backend_get("/api/jobs/poll", params={"nodeId": node_id})
+            started = time.monotonic()
+            # long-poll: the backend holds the request until a job arrives or LONG_POLL_WAIT passes
+            res = backend_get("/api/jobs/poll",
+                              params={"nodeId": node_id, "wait": LONG_POLL_WAIT, "localQueueSize": LOCAL_QUEUE_SIZE},
+                              timeout=LONG_POLL_WAIT + 5)
             if res and res.status_code == 200:
+                failures = 0
                 data = res.json()
                 job = data.get("job")
                 if job:
-                    # handle job synchronously (blocking) - this is fine for single node
-                    handle_job(job, node_id, secret_key)
-                else:
-                    print("No jobs rn 😴")
+                    local_queue.extend(data.get("jobs") or [job])
+                    continue
+                print("No jobs rn 😴")
+                if time.monotonic() - started >= LONG_POLL_WAIT:
+                    # the backend held the poll for the full window; ask again right away
+                    continue
             else:
+                failures += 1
                 print("Polling error or backend down")
         except Exception as e:
+            failures += 1
             print("Job polling failed ❌:", e)
-        time.sleep(POLL_INTERVAL)
+        # backend unreachable: back off exponentially instead of retrying at a fixed rate
+        time.sleep(min(POLL_INTERVAL * 2 ** max(failures - 1, 0), POLL_BACKOFF_MAX))
 
 # ----------------- Main -----------------
 if __name__ == "__main__":
@@ -387,20 +639,28 @@ if __name__ == "__main__":
         print("⚠️  No Aptos public key configured - earnings will not be tracked")
     specs = get_system_specs()
     print("System Specs:", specs)
+    print("Model hashing:", MODEL_HASH_ALGO, "|", ssl.OPENSSL_VERSION, "| CPU SHA extensions:", cpu_has_sha_extensions())
 
     if not check_docker_installed():
         print("Docker not detected ❌ Install Docker!")
         raise SystemExit(1)
     print("Docker runtime check ✅")
 
+    if not build_base_image():
+        print("Failed to build trainer base image; exiting.")
+        raise SystemExit(1)
+
     # register
     if not register_node(NODE_ID, specs, HANDSHAKE_KEY, APTOS_PUBLIC_KEY):
         print("Failed to register node; exiting.")
         raise SystemExit(1)
 
-    # start heartbeat thread
-    hb = threading.Thread(target=start_heartbeat, args=(NODE_ID,), daemon=True)
+    # start telemetry (heartbeat + usage) thread
+    hb = threading.Thread(target=start_telemetry, args=(NODE_ID,), daemon=True)
     hb.start()
 
     # start polling loop (blocks main thread)
-    poll_for_job_loop(NODE_ID, HANDSHAKE_KEY)
+    try:
+        poll_for_job_loop(NODE_ID, HANDSHAKE_KEY)
+    except KeyboardInterrupt:
+        print("\n\n🛑 Node agent stopped by user")
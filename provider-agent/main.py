@@ -13,47 +13,140 @@ Features implemented:
 - Aptos payment stub (clear instructions where to plug real Aptos SDK)
 
 Run:
-    pip install fastapi uvicorn requests
+    pip install fastapi uvicorn httpx aiosqlite orjson
     python main.py
 
 Then point your provider agent to BACKEND_URL (default http://localhost:8000)
 """
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from functools import wraps
 from typing import Optional, List, Dict, Any
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import aiosqlite
 import sqlite3
 import time
 import uuid
+import secrets
 import os
 import hashlib
-import json
-import threading
-import requests
+import orjson
+import httpx
 
 # --- Configuration ---
 DB_PATH = os.environ.get("SC_DB", "./shelbycompute.db")
 BACKEND_HOST = os.environ.get("SC_HOST", "0.0.0.0")
 BACKEND_PORT = int(os.environ.get("SC_PORT", os.environ.get("PORT", "8000")))
+BACKEND_WORKERS = int(os.environ.get("SC_WORKERS", os.cpu_count() or 1))  # uvicorn worker processes
+BACKEND_REUSEPORT = os.environ.get("SC_REUSEPORT") == "1"  # one SO_REUSEPORT socket per worker
+
+try:
+    import uvloop  # noqa: F401  (not available on Windows)
+    UVICORN_LOOP = "uvloop"
+except ImportError:
+    UVICORN_LOOP = "asyncio"
+try:
+    import httptools  # noqa: F401
+    UVICORN_HTTP = "httptools"
+except ImportError:
+    UVICORN_HTTP = "h11"
 SHELBY_API_URL = os.environ.get("SHELBY_API_URL")  # optional
 SHELBY_API_KEY = os.environ.get("SHELBY_API_KEY")  # optional
+SHELBY_HEADERS = {"Authorization": f"Bearer {SHELBY_API_KEY}", "Content-Type": "application/json"}
 APTOS_SENDER_ADDRESS = os.environ.get("APTOS_SENDER_ADDRESS")
 APTOS_PRIVATE_KEY = os.environ.get("APTOS_PRIVATE_KEY")
 APTOS_ESCROW_CONTRACT = os.environ.get("APTOS_ESCROW_CONTRACT", "0xd9a8605f60a8b8e124fca13eaae45ef3a4683351f7807b5b91f253616f819bf6")
 
-app = FastAPI(title="ShelbyCompute Minimal Backend")
+LOG_FLUSH_INTERVAL = int(os.environ.get("SC_LOG_BATCH_MS", "50")) / 1000  # how long a log batch keeps coalescing
+LOG_FLUSH_ROWS = int(os.environ.get("SC_LOG_BATCH_ROWS", "500"))  # flush early at this many rows...
+LOG_FLUSH_BYTES = 64 * 1024   # ...or this many bytes of log text
+LONG_POLL_MAX_SECONDS = 25    # upper bound for /api/jobs/poll?wait=...
+LONG_POLL_RECHECK = 2         # re-query interval while held (covers jobs made pending elsewhere)
+LOCAL_QUEUE_MAX = 16          # upper bound for /api/jobs/poll?localQueueSize=...
+CLAIM_LEASE_SECONDS = 120     # a polled job its node neither acks nor heartbeats for within this goes back to pending
+SCRIPT_CACHE_SIZE = 1024      # uploaded scripts kept in memory per worker (LRU)
+SCRIPT_CACHE_TTL = 60         # seconds; bounds staleness after an upload handled by another worker
+STATS_CACHE_TTL = 1.0         # seconds the dashboard/stats/health responses are reused across polls
+POSTJOB_WORKERS = 4           # asyncio tasks running post-job actions (Shelby, payment, Photon)
+TASK_POLL_INTERVAL = 2        # seconds idle post-job workers wait before re-checking the tasks table
+TASK_LEASE_SECONDS = 300      # a claimed task not finished within this is retried (worker died mid-task)
+TASK_MAX_ATTEMPTS = 5         # failed tasks are retried with exponential backoff up to this many attempts
+LOG_RETENTION_DAYS = float(os.environ.get("SC_LOG_RETENTION_DAYS", "7"))  # older log rows are pruned; 0 keeps everything
+LOG_PRUNE_INTERVAL = 3600     # seconds between log pruning passes
+LOG_PRUNE_BATCH = 5000        # log rows examined per pruning transaction (the write lock is released between batches)
+HEARTBEAT_FLUSH_INTERVAL = 2  # seconds node heartbeats are buffered before one batched last_seen write
+DB_READ_POOL_SIZE = int(os.environ.get("SC_DB_READERS", "4"))  # read-only connections per worker
+# applied to every connection; WAL lets the read pool run alongside the single writer
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",  # read pages straight from a 256 MiB memory map
+    "PRAGMA busy_timeout=5000",
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one long-lived write connection per worker process, shared by all requests on its event loop,
+    # plus a small pool of read-only connections that read-only endpoints borrow through db_read()
+    # autocommit mode: db_write() opens its transactions explicitly
+    app.state.db = await open_db(DB_PATH, isolation_level=None)
+    app.state.db_write_lock = asyncio.Lock()
+    app.state.read_pool = asyncio.Queue()
+    read_uri = Path(DB_PATH).resolve().as_uri() + "?mode=ro"
+    for _ in range(DB_READ_POOL_SIZE):
+        app.state.read_pool.put_nowait(await open_db(read_uri, uri=True))
+    # replaced and set each time a job becomes pending; long-polls wait on it
+    app.state.job_available = asyncio.Event()
+    # log rows from all producers are queued and written by a single flusher task
+    app.state.log_queue = asyncio.Queue()
+    flusher = asyncio.create_task(log_flusher(app.state.log_queue))
+    # latest heartbeat per node (node_id -> ts), written to nodes.last_seen in batches
+    app.state.heartbeats = {}
+    heartbeat_stop = asyncio.Event()
+    heartbeat_writer = asyncio.create_task(heartbeat_flusher(heartbeat_stop))
+    pruner = asyncio.create_task(log_pruner()) if LOG_RETENTION_DAYS > 0 else None
+    reaper = asyncio.create_task(claim_reaper())
+    # post-job actions are durable rows in the tasks table, run by a fixed set of workers;
+    # finish_job sets task_available so a local worker picks new tasks up immediately
+    app.state.task_available = asyncio.Event()
+    tasks_stop = asyncio.Event()
+    postjob_workers = [asyncio.create_task(task_worker(tasks_stop)) for _ in range(POSTJOB_WORKERS)]
+    # pooled keep-alive client for outbound calls (Shelby provenance writes)
+    app.state.http = httpx.AsyncClient(timeout=10, limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+    yield
+    reaper.cancel()
+    if pruner:
+        pruner.cancel()
+    # workers finish the task they are running; anything left stays queued in the database
+    tasks_stop.set()
+    app.state.task_available.set()
+    await asyncio.gather(*postjob_workers)
+    heartbeat_stop.set()
+    await heartbeat_writer
+    await app.state.http.aclose()
+    # sentinel: flusher writes whatever is still queued, then exits
+    app.state.log_queue.put_nowait(None)
+    await flusher
+    while not app.state.read_pool.empty():
+        await app.state.read_pool.get_nowait().close()
+    await app.state.db.close()
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (C encoder, several times faster than stdlib json)"""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
 
-# Handle OPTIONS requests for CORS preflight
-@app.options("/{rest_of_path:path}")
-async def preflight_handler(request: Request, rest_of_path: str) -> JSONResponse:
-    response = JSONResponse(content="OK")
-    response.headers['Access-Control-Allow-Origin'] = '*'
-    response.headers['Access-Control-Allow-Methods'] = 'POST, GET, DELETE, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = '*'
-    return response
+app = FastAPI(title="ShelbyCompute Minimal Backend", lifespan=lifespan,
+              default_response_class=ORJSONResponse)
 
-# Add CORS middleware
+# CORS middleware (also answers preflight OPTIONS requests)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -69,9 +162,19 @@ app.add_middleware(
 )
 
 # --- DB helpers ---
+async def open_db(database, **kwargs):
+    db = await aiosqlite.connect(database, **kwargs)
+    # rows stay indexable like tuples and can also be read by column name
+    db.row_factory = sqlite3.Row
+    for pragma in SQLITE_PRAGMAS:
+        await db.execute(pragma)
+    return db
+
 def init_db():
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
+    # persistent: the database file stays in WAL mode for every later connection
+    c.execute("PRAGMA journal_mode=WAL")
     c.execute('''
         CREATE TABLE IF NOT EXISTS nodes (
             node_id TEXT PRIMARY KEY,
@@ -88,7 +191,11 @@ def init_db():
             assigned_node TEXT,
             started_at INTEGER,
             finished_at INTEGER,
-            result TEXT
+            result TEXT,
+            dataset_name TEXT,
+            dataset_url TEXT,
+            dataset_hash TEXT,
+            meta TEXT
         )
     ''')
     c.execute('''
@@ -96,7 +203,13 @@ def init_db():
             id TEXT PRIMARY KEY,
             job_id TEXT,
             record TEXT,
-            created_at INTEGER
+            created_at INTEGER,
+            node_id TEXT,
+            model_hash TEXT,
+            model_hash_algo TEXT,
+            model_size_bytes INTEGER,
+            duration_seconds INTEGER,
+            metadata TEXT
         )
     ''')
     c.execute('''
@@ -107,6 +220,30 @@ def init_db():
             ts INTEGER
         )
     ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT,
+            payload TEXT,
+            status TEXT,
+            attempts INTEGER DEFAULT 0,
+            next_run INTEGER,
+            last_error TEXT,
+            created_at INTEGER
+        )
+    ''')
+    # one row per aptos_payment task, written before the transfer is sent: makes re-runs of the task
+    # idempotent, while a restarted job that finishes again queues a new task and is paid again
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS payments (
+            task_id INTEGER PRIMARY KEY,
+            job_id TEXT,
+            node_id TEXT,
+            amount REAL,
+            tx_hash TEXT,
+            created_at INTEGER
+        )
+    ''')
     c.execute('''
         CREATE TABLE IF NOT EXISTS job_scripts (
             job_id TEXT PRIMARY KEY,
@@ -116,7 +253,18 @@ def init_db():
             created_at INTEGER
         )
     ''')
-    
+    # poll_for_job claims the oldest pending job: index range scan instead of scan + sort
+    c.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)')
+    # per-job log reads (newest first, or in order) and provenance lookups by job
+    c.execute('CREATE INDEX IF NOT EXISTS idx_logs_jobid_id ON logs(job_id, id DESC)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_prov_jobid ON provenance(job_id)')
+    # post-job workers claim the oldest due task
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status_next_run ON tasks(status, next_run)')
+    # active-node counts (last_seen > ?) and per-node job lookups (delete_node, earnings, payments);
+    # finished_at lets payments read each node's newest finished jobs straight off the index
+    c.execute('CREATE INDEX IF NOT EXISTS idx_nodes_lastseen ON nodes(last_seen)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_jobs_node_status_finished ON jobs(assigned_node, status, finished_at DESC)')
+
     # Add created_at column if it doesn't exist (for existing databases)
     try:
         c.execute('ALTER TABLE job_scripts ADD COLUMN created_at INTEGER')
@@ -124,6 +272,62 @@ def init_db():
     except sqlite3.OperationalError:
         # Column already exists, ignore
         pass
+
+    # Job payload and provenance record fields live in their own columns (only meta/metadata stay JSON).
+    # Existing databases get the columns added and old rows moved out of the payload/record JSON.
+    for table, column, decl in (
+        ("jobs", "dataset_name", "TEXT"),
+        ("jobs", "dataset_url", "TEXT"),
+        ("jobs", "dataset_hash", "TEXT"),
+        ("jobs", "meta", "TEXT"),
+        ("provenance", "node_id", "TEXT"),
+        ("provenance", "model_hash", "TEXT"),
+        ("provenance", "model_hash_algo", "TEXT"),
+        ("provenance", "model_size_bytes", "INTEGER"),
+        ("provenance", "duration_seconds", "INTEGER"),
+        ("provenance", "metadata", "TEXT"),
+        ("nodes", "aptos_public_key", "TEXT"),
+        ("jobs", "acked_at", "INTEGER"),
+        ("jobs", "claimed_at", "INTEGER"),
+    ):
+        try:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+        except sqlite3.OperationalError:
+            continue
+        if column == "acked_at":
+            # jobs assigned before claims were tracked count as acked, so the claim lease leaves them alone
+            c.execute("UPDATE jobs SET acked_at = started_at WHERE status = 'assigned'")
+        elif column == "claimed_at":
+            c.execute("UPDATE jobs SET claimed_at = started_at WHERE status = 'assigned'")
+    c.execute('''
+        UPDATE jobs SET
+            dataset_name = json_extract(payload, '$.datasetName'),
+            dataset_url = json_extract(payload, '$.datasetUrl'),
+            dataset_hash = json_extract(payload, '$.datasetHash'),
+            meta = json_extract(payload, '$.meta'),
+            payload = NULL
+        WHERE payload IS NOT NULL
+    ''')
+    c.execute('''
+        UPDATE provenance SET
+            node_id = json_extract(record, '$.nodeId'),
+            model_hash = json_extract(record, '$.modelHash'),
+            model_hash_algo = COALESCE(json_extract(record, '$.modelHashAlgo'), 'sha256'),
+            model_size_bytes = json_extract(record, '$.modelSizeBytes'),
+            duration_seconds = json_extract(record, '$.durationSeconds'),
+            metadata = json_extract(record, '$.metadata'),
+            record = NULL
+        WHERE record IS NOT NULL
+    ''')
+    # node owner key gets its own indexed column; the earnings/payments endpoints filter on it
+    c.execute('''
+        UPDATE nodes SET aptos_public_key = json_extract(info, '$.aptosPublicKey')
+        WHERE aptos_public_key IS NULL AND json_extract(info, '$.aptosPublicKey') IS NOT NULL
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_nodes_aptos ON nodes(aptos_public_key)')
+    # refresh planner statistics; analysis_limit samples big tables so startup stays quick
+    c.execute('PRAGMA analysis_limit=1000')
+    c.execute('ANALYZE')
     conn.commit()
     conn.close()
 
@@ -137,8 +341,12 @@ class NodeRegister(BaseModel):
     handshakeKey: Optional[str] = None
     aptosPublicKey: Optional[str] = None
 
-class HeartbeatIn(BaseModel):
+class TelemetryIn(BaseModel):
     nodeId: str
+    jobId: Optional[str] = None
+    cpu: float
+    ram: float
+    ts: int
 
 class JobCreateIn(BaseModel):
     jobId: Optional[str] = None
@@ -150,6 +358,7 @@ class JobCreateIn(BaseModel):
 
 class JobPollOut(BaseModel):
     job: Optional[Dict[str, Any]] = None
+    jobs: List[Dict[str, Any]] = []
 
 class JobAckIn(BaseModel):
     nodeId: str
@@ -167,6 +376,7 @@ class FinishJobIn(BaseModel):
     nodeId: str
     jobId: str
     modelHash: str
+    modelHashAlgo: str = "sha256"
     modelSizeBytes: int
     metadata: Dict[str, Any]
     durationSeconds: int
@@ -177,176 +387,306 @@ class JobScriptUpload(BaseModel):
     requirements: Optional[str] = None
     entrypoint: str = "train.py"
 
-class StreamLogRequest(BaseModel):
+class StreamLogBatchRequest(BaseModel):
     job_id: str
-    line: str
+    lines: List[str]
 
 # --- Helper utilities ---
-def db_connect():
-    return sqlite3.connect(DB_PATH)
-
 def now_ts():
     return int(time.time())
 
+# jobId -> (expires_at, fetch-script response); invalidated on upload/delete in this worker
+_script_cache = OrderedDict()
+
+def script_cache_get(job_id):
+    entry = _script_cache.get(job_id)
+    if entry is None:
+        return None
+    if entry[0] < time.monotonic():
+        del _script_cache[job_id]
+        return None
+    _script_cache.move_to_end(job_id)
+    return entry[1]
+
+def script_cache_put(job_id, value):
+    _script_cache[job_id] = (time.monotonic() + SCRIPT_CACHE_TTL, value)
+    _script_cache.move_to_end(job_id)
+    if len(_script_cache) > SCRIPT_CACHE_SIZE:
+        _script_cache.popitem(last=False)
+
+async def read_str_fields(request: Request, *fields: str) -> List[str]:
+    """
+    Pull required string fields out of a small JSON body with orjson, skipping Pydantic model
+    validation on the highest-rate endpoints (heartbeat, stream-log)
+    """
+    try:
+        body = orjson.loads(await request.body())
+        values = [body[f] for f in fields]
+    except (orjson.JSONDecodeError, KeyError, TypeError):
+        values = None
+    if values is None or not all(isinstance(v, str) for v in values):
+        raise HTTPException(status_code=422, detail=f"expected a JSON object with string fields: {', '.join(fields)}")
+    return values
+
+def cached_response(ttl: float):
+    """Reuse a parameterless endpoint's response for `ttl` seconds, so frequent frontend polls share one set of queries"""
+    def decorator(fn):
+        entry = [0.0, None]   # expires_at, response
+
+        @wraps(fn)
+        async def wrapper():
+            now = time.monotonic()
+            if entry[0] < now:
+                entry[1] = await fn()
+                entry[0] = now + ttl
+            return entry[1]
+        return wrapper
+    return decorator
+
+@asynccontextmanager
+async def db_write():
+    """
+    Write transaction on the shared connection; one at a time, since SQLite has a single writer.
+    BEGIN IMMEDIATE takes the write lock up front (waiting up to busy_timeout for other worker
+    processes) instead of upgrading mid-transaction and failing with SQLITE_BUSY.
+    """
+    async with app.state.db_write_lock:
+        db = app.state.db
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            await db.rollback()
+            raise
+        await db.commit()
+
+@asynccontextmanager
+async def db_read():
+    """Borrow a read-only connection from the pool"""
+    db = await app.state.read_pool.get()
+    try:
+        yield db
+    finally:
+        app.state.read_pool.put_nowait(db)
+
+def _wake_pollers():
+    """Wake long-polling /api/jobs/poll requests"""
+    event = app.state.job_available
+    app.state.job_available = asyncio.Event()
+    event.set()
+
 # --- Endpoints ---
 @app.post("/api/nodes/register")
-def register_node(payload: NodeRegister):
-    conn = db_connect()
-    c = conn.cursor()
-    
+async def register_node(payload: NodeRegister):
     # Include Aptos public key in node info
     node_info = payload.specs.copy()
     if payload.aptosPublicKey:
         node_info['aptosPublicKey'] = payload.aptosPublicKey
     
-    c.execute("INSERT OR REPLACE INTO nodes (node_id, info, last_seen) VALUES (?, ?, ?)",
-              (payload.nodeId, json.dumps(node_info), now_ts()))
-    conn.commit()
-    conn.close()
+    async with db_write() as db:
+        await db.execute("INSERT OR REPLACE INTO nodes (node_id, info, last_seen, aptos_public_key) VALUES (?, ?, ?, ?)",
+                         (payload.nodeId, orjson.dumps(node_info).decode(), now_ts(), payload.aptosPublicKey))
     return {"status": "ok", "nodeId": payload.nodeId}
 
 @app.post("/api/nodes/heartbeat")
-def heartbeat(hb: HeartbeatIn):
-    conn = db_connect()
-    c = conn.cursor()
-    c.execute("UPDATE nodes SET last_seen = ? WHERE node_id = ?", (now_ts(), hb.nodeId))
-    conn.commit()
-    conn.close()
-    return {"status": "ok", "nodeId": hb.nodeId}
+async def heartbeat(request: Request):
+    node_id, = await read_str_fields(request, "nodeId")
+    app.state.heartbeats[node_id] = now_ts()
+    return {"status": "ok", "nodeId": node_id}
+
+@app.post("/api/nodes/telemetry")
+async def node_telemetry(t: TelemetryIn):
+    """Heartbeat plus a CPU/RAM sample; the sample is logged against the job the node is running, if any"""
+    ts = now_ts()
+    app.state.heartbeats[t.nodeId] = ts
+    if t.jobId:
+        line = orjson.dumps({"cpu": t.cpu, "ram": t.ram, "ts": t.ts}).decode()
+        app.state.log_queue.put_nowait((t.jobId, line, ts))
+    return {"status": "ok", "nodeId": t.nodeId}
 
 @app.post("/api/jobs/create")
-def create_job(job: JobCreateIn):
+async def create_job(job: JobCreateIn):
     job_id = job.jobId or str(uuid.uuid4())
-    payload = {
-        "jobId": job_id,
-        "datasetName": job.datasetName,
-        "datasetUrl": job.datasetUrl,
-        "datasetHash": job.datasetHash,
-        "meta": job.meta,
-        "createdAt": now_ts()
-    }
-    conn = db_connect()
-    c = conn.cursor()
-    c.execute("INSERT INTO jobs (job_id, status, payload, created_at) VALUES (?, ?, ?, ?)",
-              (job_id, "pending", json.dumps(payload), now_ts()))
-    conn.commit()
-    conn.close()
+    ts = now_ts()
+    async with db_write() as db:
+        await db.execute("""
+            INSERT INTO jobs (job_id, status, dataset_name, dataset_url, dataset_hash, meta, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (job_id, "pending", job.datasetName, job.datasetUrl, job.datasetHash, orjson.dumps(job.meta).decode(), ts))
+    _wake_pollers()
     return {"status": "ok", "jobId": job_id}
 
+async def claim_pending_jobs(node_id: str, limit: int):
+    # first-come-first-serve: atomically claim the oldest `limit` pending jobs for this node.
+    # A single UPDATE ... RETURNING (SQLite >= 3.35) runs under the database write lock,
+    # so two nodes polling at once can never be handed the same job.
+    async with db_write() as db:
+        # an agent only polls once it has acked everything it was handed, so jobs still unacked
+        # here were never delivered (dropped response, client timeout): put them back in line first
+        await db.execute("""
+            UPDATE jobs SET status = 'pending', assigned_node = NULL, claimed_at = NULL, started_at = NULL
+            WHERE assigned_node = ? AND status = 'assigned' AND acked_at IS NULL
+        """, (node_id,))
+        # started_at stays unset until ack: time spent waiting in an agent's local queue is not billed
+        async with db.execute("""
+            UPDATE jobs SET status = 'assigned', assigned_node = ?, claimed_at = ?, started_at = NULL, acked_at = NULL
+            WHERE rowid IN (SELECT rowid FROM jobs WHERE status = 'pending' ORDER BY created_at LIMIT ?)
+            RETURNING job_id, dataset_name, dataset_url, meta, created_at
+        """, (node_id, now_ts(), limit)) as c:
+            rows = await c.fetchall()
+    # RETURNING order is unspecified; hand the jobs out oldest first
+    rows.sort(key=lambda r: r[4])
+    return rows
+
 @app.get("/api/jobs/poll", response_model=JobPollOut)
-def poll_for_job(nodeId: str):
-    # simple first-come-first-serve: return the oldest pending job
-    conn = db_connect()
-    c = conn.cursor()
-    c.execute("SELECT job_id, payload FROM jobs WHERE status = 'pending' ORDER BY created_at LIMIT 1")
-    row = c.fetchone()
-    if not row:
-        conn.close()
-        return {"job": None}
-    job_id, payload_json = row
-    payload = json.loads(payload_json)
-    # assign tentatively but keep status pending until ack
-    conn.close()
-    return { "job": {
-        "jobId": payload.get("jobId"),
-        "datasetName": payload.get("datasetName"),
-        "dataset": payload.get("datasetName"),   # <-- alias for CLI compatibility
-        "datasetUrl": payload.get("datasetUrl"),
-        "meta": payload.get("meta"),
-        "createdAt": payload.get("createdAt")
-    }   }
+async def poll_for_job(request: Request, nodeId: str, wait: float = 0, localQueueSize: int = 1):
+    """
+    Claim the oldest pending job, or up to `localQueueSize` of them (max LOCAL_QUEUE_MAX) for
+    agents that keep a local queue; `job` is the first and `jobs` holds all claimed jobs.
+    With wait > 0 the request is held open (long-poll) for up to `wait` seconds
+    (max LONG_POLL_MAX_SECONDS) until a job is created.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(max(wait, 0), LONG_POLL_MAX_SECONDS)
+    limit = min(max(localQueueSize, 1), LOCAL_QUEUE_MAX)
+    woken = False
+    while True:
+        # grab the event before querying so a job created mid-query still wakes us
+        job_available = app.state.job_available
+        # a client that gave up on the long-poll would never see the jobs claimed for it
+        if await request.is_disconnected():
+            return {"job": None, "jobs": []}
+        # cheap read-only probe on rechecks, so a held long-poll doesn't take the write lock every time;
+        # this node's unacked claims count too, since claiming is what releases them
+        if not woken:
+            async with db_read() as db, db.execute("""
+                SELECT 1 FROM jobs WHERE status = 'pending'
+                   OR (assigned_node = ? AND status = 'assigned' AND acked_at IS NULL) LIMIT 1
+            """, (nodeId,)) as c:
+                woken = await c.fetchone() is not None
+        if woken:
+            rows = await claim_pending_jobs(nodeId, limit)
+            if rows:
+                break
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            return {"job": None, "jobs": []}
+        try:
+            await asyncio.wait_for(job_available.wait(), min(timeout, LONG_POLL_RECHECK))
+            woken = True
+        except asyncio.TimeoutError:
+            woken = False
+    jobs = [{
+        "jobId": job_id,
+        "datasetName": dataset_name,
+        "dataset": dataset_name,   # <-- alias for CLI compatibility
+        "datasetUrl": dataset_url,
+        "meta": orjson.loads(meta_json) if meta_json else None,
+        "createdAt": created_at
+    } for job_id, dataset_name, dataset_url, meta_json, created_at in rows]
+    return {"job": jobs[0], "jobs": jobs}
 
 @app.post("/api/jobs/ack")
-def ack_job(payload: JobAckIn):
-    conn = db_connect()
-    c = conn.cursor()
-    # mark job as assigned
-    c.execute("UPDATE jobs SET status = ?, assigned_node = ?, started_at = ? WHERE job_id = ? AND status = 'pending'",
-              ("assigned", payload.nodeId, now_ts(), payload.jobId))
-    conn.commit()
-    updated = c.rowcount
-    conn.close()
+async def ack_job(payload: JobAckIn):
+    # jobs are claimed at poll time; ack confirms the claim (and still assigns a job that is pending).
+    # The agent acks right before running the job, so this is when it starts
+    ts = now_ts()
+    async with db_write() as db:
+        async with db.execute("""
+            UPDATE jobs SET status = 'assigned', assigned_node = ?, started_at = ?, acked_at = ?
+            WHERE job_id = ? AND (status = 'pending' OR (status = 'assigned' AND assigned_node = ?))
+        """, (payload.nodeId, ts, ts, payload.jobId, payload.nodeId)) as c:
+            updated = c.rowcount
     if updated == 0:
         raise HTTPException(status_code=400, detail="Job not available for assignment")
     return {"status": "ok", "jobId": payload.jobId}
 
 @app.post("/api/jobs/finish")
-def finish_job(finish: FinishJobIn, background_tasks: BackgroundTasks):
-    conn = db_connect()
-    c = conn.cursor()
-    c.execute("SELECT status FROM jobs WHERE job_id = ?", (finish.jobId,))
-    row = c.fetchone()
-    if not row:
-        raise HTTPException(status_code=404, detail="job not found")
-    c.execute("UPDATE jobs SET status = ?, finished_at = ?, result = ? WHERE job_id = ?",
-              ("finished", now_ts(), json.dumps({"modelHash": finish.modelHash, "meta": finish.metadata}), finish.jobId))
-    # write provenance record
+async def finish_job(finish: FinishJobIn):
+    ts = now_ts()
     prov_id = str(uuid.uuid4())
     record = {
         "jobId": finish.jobId,
         "nodeId": finish.nodeId,
         "modelHash": finish.modelHash,
+        "modelHashAlgo": finish.modelHashAlgo,
         "modelSizeBytes": finish.modelSizeBytes,
         "durationSeconds": finish.durationSeconds,
         "metadata": finish.metadata,
-        "ts": now_ts()
+        "ts": ts
     }
-    c.execute("INSERT INTO provenance (id, job_id, record, created_at) VALUES (?, ?, ?, ?)",
-              (prov_id, finish.jobId, json.dumps(record), now_ts()))
-    conn.commit()
-    conn.close()
-
-    # background actions: push to shelby (if config), process payment, trigger photon
-    background_tasks.add_task(process_post_job_actions, finish.jobId, finish.nodeId, record)
+    async with db_write() as db:
+        # only a running job can finish: a retried /finish must not queue a second payment
+        async with db.execute("UPDATE jobs SET status = ?, finished_at = ?, result = ? WHERE job_id = ? AND status = 'assigned' RETURNING started_at",
+                              ("finished", ts, orjson.dumps({"modelHash": finish.modelHash, "modelHashAlgo": finish.modelHashAlgo, "meta": finish.metadata}).decode(), finish.jobId)) as c:
+            row = await c.fetchone()
+        if not row:
+            async with db.execute("SELECT status FROM jobs WHERE job_id = ?", (finish.jobId,)) as c:
+                job = await c.fetchone()
+            if not job:
+                raise HTTPException(status_code=404, detail="job not found")
+            raise HTTPException(status_code=409, detail=f"job is {job[0]}, not assigned")
+        # write provenance record
+        await db.execute("""
+            INSERT INTO provenance (id, job_id, node_id, model_hash, model_hash_algo, model_size_bytes,
+                                    duration_seconds, metadata, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (prov_id, finish.jobId, finish.nodeId, finish.modelHash, finish.modelHashAlgo,
+              finish.modelSizeBytes, finish.durationSeconds, orjson.dumps(finish.metadata).decode(), ts))
+        # background actions: push to shelby (if config), process payment, trigger photon;
+        # queued in the same transaction so they survive a restart
+        tasks = [
+            ("aptos_payment", {"jobId": finish.jobId, "nodeId": finish.nodeId, "cost": calculate_cost(row[0], ts)}),
+            ("photon_reward", {"jobId": finish.jobId, "nodeId": finish.nodeId}),
+        ]
+        if SHELBY_API_URL and SHELBY_API_KEY:
+            tasks.insert(0, ("shelby_write", {"record": record}))
+        await db.executemany("""
+            INSERT INTO tasks (type, payload, status, next_run, created_at) VALUES (?, ?, 'pending', ?, ?)
+        """, [(task_type, orjson.dumps(payload).decode(), ts, ts) for task_type, payload in tasks])
+    app.state.task_available.set()
 
     return {"status": "ok", "jobId": finish.jobId, "provenanceId": prov_id}
 
 @app.post("/api/jobs/stream-log")
-def stream_log(log_request: StreamLogRequest):
-    try:
-        conn = db_connect()
-        c = conn.cursor()
-        c.execute("INSERT INTO logs (job_id, line, ts) VALUES (?, ?, ?)", 
-                 (log_request.job_id, log_request.line, now_ts()))
-        conn.commit()
-        conn.close()
-        return {"status": "ok"}
-    except Exception as e:
-        print(f"Error streaming log: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to stream log: {str(e)}")
+async def stream_log(request: Request):
+    job_id, line = await read_str_fields(request, "job_id", "line")
+    app.state.log_queue.put_nowait((job_id, line, now_ts()))
+    return {"status": "ok"}
+
+@app.post("/api/jobs/stream-log-batch")
+async def stream_log_batch(batch: StreamLogBatchRequest):
+    """Queue a batch of log lines for a job; they are written together by the log flusher"""
+    ts = now_ts()
+    for line in batch.lines:
+        app.state.log_queue.put_nowait((batch.job_id, line, ts))
+    return {"status": "ok", "count": len(batch.lines)}
 
 @app.post("/api/usage-report")
-def usage_report(rep: UsageReport):
+async def usage_report(rep: UsageReport):
     # store usage into logs table as simple metric lines
-    conn = db_connect()
-    c = conn.cursor()
-    line = json.dumps({"cpu": rep.cpu_percent, "ram": rep.ram_percent, "ts": rep.ts})
-    c.execute("INSERT INTO logs (job_id, line, ts) VALUES (?, ?, ?)", (rep.jobId, line, now_ts()))
-    conn.commit()
-    conn.close()
+    line = orjson.dumps({"cpu": rep.cpu_percent, "ram": rep.ram_percent, "ts": rep.ts}).decode()
+    app.state.log_queue.put_nowait((rep.jobId, line, now_ts()))
     return {"status": "ok"}
 
 @app.post("/api/jobs/upload-script")
-def upload_script(script: JobScriptUpload):
+async def upload_script(script: JobScriptUpload):
     """Upload a training script for a job"""
     print(f"Received script upload request for job: {script.jobId}")
     try:
-        conn = db_connect()
-        c = conn.cursor()
-        
         # Validate input
         if not script.jobId or not script.script:
             print(f"Validation failed - jobId: {bool(script.jobId)}, script: {bool(script.script)}")
             raise HTTPException(status_code=400, detail="jobId and script are required")
         
         print(f"Inserting script for job {script.jobId}, script length: {len(script.script)}")
-        c.execute("""
-            INSERT OR REPLACE INTO job_scripts (job_id, script, requirements, entrypoint, created_at) 
-            VALUES (?, ?, ?, ?, ?)
-        """, (script.jobId, script.script, script.requirements or "", script.entrypoint, now_ts()))
-        conn.commit()
-        conn.close()
+        async with db_write() as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO job_scripts (job_id, script, requirements, entrypoint, created_at) 
+                VALUES (?, ?, ?, ?, ?)
+            """, (script.jobId, script.script, script.requirements or "", script.entrypoint, now_ts()))
         
+        _script_cache.pop(script.jobId, None)
         print(f"Script uploaded successfully for job: {script.jobId}")
         return {"status": "ok", "message": "Script uploaded successfully", "jobId": script.jobId}
     except Exception as e:
@@ -356,21 +696,20 @@ def upload_script(script: JobScriptUpload):
         raise HTTPException(status_code=500, detail=f"Failed to upload script: {str(e)}")
 
 @app.get("/api/jobs/fetch-script")
-def fetch_script(jobId: str):
+async def fetch_script(jobId: str):
     """Fetch training script for a job"""
-    conn = db_connect()
-    c = conn.cursor()
-    
-    # First check if job exists
-    c.execute("SELECT job_id FROM jobs WHERE job_id = ?", (jobId,))
-    if not c.fetchone():
-        conn.close()
-        raise HTTPException(status_code=404, detail="Job not found")
-    
-    # Then check for script
-    c.execute("SELECT script, requirements, entrypoint FROM job_scripts WHERE job_id = ?", (jobId,))
-    row = c.fetchone()
-    conn.close()
+    cached = script_cache_get(jobId)
+    if cached is not None:
+        return cached
+    async with db_read() as db:
+        # First check if job exists
+        async with db.execute("SELECT job_id FROM jobs WHERE job_id = ?", (jobId,)) as c:
+            if not await c.fetchone():
+                raise HTTPException(status_code=404, detail="Job not found")
+
+        # Then check for script
+        async with db.execute("SELECT script, requirements, entrypoint FROM job_scripts WHERE job_id = ?", (jobId,)) as c:
+            row = await c.fetchone()
     
     if not row:
         # Return default script if no custom script uploaded
@@ -380,58 +719,235 @@ def fetch_script(jobId: str):
             "entrypoint": "train.py"
         }
     
-    return {
+    script = {
         "script": row[0],
         "requirements": row[1] or "",
         "entrypoint": row[2] or "train.py"
     }
+    script_cache_put(jobId, script)
+    return script
+
+# --- Log ingest batching ---
+async def write_log_rows(rows):
+    async with db_write() as db:
+        await db.executemany("INSERT INTO logs (job_id, line, ts) VALUES (?, ?, ?)", rows)
+
+async def heartbeat_flusher(stop: asyncio.Event):
+    """Write buffered heartbeats every HEARTBEAT_FLUSH_INTERVAL, and a final time once `stop` is set"""
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), HEARTBEAT_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        pending, app.state.heartbeats = app.state.heartbeats, {}
+        if not pending:
+            continue
+        try:
+            async with db_write() as db:
+                await db.executemany("UPDATE nodes SET last_seen = ? WHERE node_id = ?",
+                                     [(ts, node_id) for node_id, ts in pending.items()])
+        except Exception as e:
+            print("Heartbeat flush failed:", e)
+
+async def claim_reaper():
+    """
+    Every CLAIM_LEASE_SECONDS / 4, put jobs claimed by a poll back to pending when they were never
+    acked and their node has not sent a heartbeat or telemetry for CLAIM_LEASE_SECONDS
+    (agent crashed or restarted with a new node id, or the poll response was lost)
+    """
+    while True:
+        await asyncio.sleep(CLAIM_LEASE_SECONDS / 4)
+        try:
+            cutoff = now_ts() - CLAIM_LEASE_SECONDS
+            async with db_write() as db:
+                async with db.execute("""
+                    UPDATE jobs SET status = 'pending', assigned_node = NULL, claimed_at = NULL, started_at = NULL
+                    WHERE status = 'assigned' AND acked_at IS NULL AND claimed_at < ?
+                      AND NOT EXISTS (SELECT 1 FROM nodes WHERE node_id = jobs.assigned_node AND last_seen >= ?)
+                """, (cutoff, cutoff)) as c:
+                    released = c.rowcount
+            if released:
+                print(f"Released {released} unacked job claim(s) back to pending")
+                _wake_pollers()
+        except Exception as e:
+            print("Releasing expired job claims failed:", e)
+
+async def log_pruner():
+    """
+    Every LOG_PRUNE_INTERVAL, delete log rows (and completed post-job tasks) older than
+    LOG_RETENTION_DAYS, shrink the WAL
+    and let PRAGMA optimize refresh planner statistics that have drifted
+    """
+    while True:
+        try:
+            cutoff = now_ts() - int(LOG_RETENTION_DAYS * 86400)
+            # logs has no ts index (it would cost every insert), but ids grow with ts: walk the oldest
+            # rows by rowid in bounded batches and stop at the first batch that reaches retained rows
+            deleted = 0
+            while True:
+                async with db_write() as db:
+                    async with db.execute("""
+                        DELETE FROM logs WHERE id IN (SELECT id FROM logs ORDER BY id LIMIT ?) AND ts < ?
+                    """, (LOG_PRUNE_BATCH, cutoff)) as c:
+                        batch = c.rowcount
+                deleted += batch
+                if batch < LOG_PRUNE_BATCH:
+                    break
+                await asyncio.sleep(0)  # let queued writers in between batches
+            async with db_write() as db:
+                await db.execute("DELETE FROM tasks WHERE status = 'done' AND next_run < ?", (cutoff,))
+            if deleted:
+                print(f"Pruned {deleted} log rows older than {LOG_RETENTION_DAYS:g} days")
+                # checkpoint outside a transaction, still holding the writer lock
+                async with app.state.db_write_lock:
+                    await app.state.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            async with app.state.db_write_lock:
+                await app.state.db.execute("PRAGMA optimize")
+        except Exception as e:
+            print("Log pruning failed:", e)
+        await asyncio.sleep(LOG_PRUNE_INTERVAL)
+
+async def log_flusher(queue: asyncio.Queue):
+    """
+    Coalesce queued (job_id, line, ts) rows from concurrent producers into one
+    INSERT batch per LOG_FLUSH_INTERVAL window (or LOG_FLUSH_ROWS / LOG_FLUSH_BYTES, if sooner).
+    A None row is the shutdown sentinel.
+    """
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        row = await queue.get()
+        if row is None:
+            break
+        rows = [row]
+        size = len(row[1])
+        deadline = loop.time() + LOG_FLUSH_INTERVAL
+        while size < LOG_FLUSH_BYTES and len(rows) < LOG_FLUSH_ROWS:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if row is None:
+                stopping = True
+                break
+            rows.append(row)
+            size += len(row[1])
+        try:
+            await write_log_rows(rows)
+        except Exception as e:
+            print(f"Error writing log batch ({len(rows)} rows): {e}")
 
 # --- Background processing ---
-def process_post_job_actions(job_id: str, node_id: str, record: Dict[str, Any]):
-    # 1) write to Shelby if configured
-    try:
-        if SHELBY_API_URL and SHELBY_API_KEY:
-            write_to_shelby(record)
-    except Exception as e:
-        print("Shelby write failed:", e)
+class TaskNotRetryable(Exception):
+    """A post-job task failure that task_worker marks failed instead of retrying"""
 
-    # 2) calculate cost and (optional) execute Aptos payment
-    try:
-        cost = calculate_cost_for_job(job_id)
-        tx = None
-        if APTOS_SENDER_ADDRESS and APTOS_PRIVATE_KEY:
-            tx = execute_aptos_payment(node_id, cost)
-        else:
-            print("Aptos credentials not configured; skipping on-chain payment. Implement execute_aptos_payment() to send real txs.")
-    except Exception as e:
-        print("Payment processing failed:", e)
+async def claim_task():
+    """Lease the oldest due task: pending ones, or claimed ones whose worker never finished them"""
+    ts = now_ts()
+    # cheap read-only probe first, so idle workers don't take the write lock every poll
+    async with db_read() as db, db.execute(
+            "SELECT 1 FROM tasks WHERE status IN ('pending', 'running') AND next_run <= ? LIMIT 1", (ts,)) as c:
+        if await c.fetchone() is None:
+            return None
+    async with db_write() as db:
+        async with db.execute("""
+            UPDATE tasks SET status = 'running', attempts = attempts + 1, next_run = ?
+            WHERE id = (SELECT id FROM tasks WHERE status IN ('pending', 'running') AND next_run <= ?
+                        ORDER BY next_run, id LIMIT 1)
+            RETURNING id, type, payload, attempts
+        """, (ts + TASK_LEASE_SECONDS, ts)) as c:
+            return await c.fetchone()
 
-    # 3) trigger Photon reward (placeholder HTTP call if Photon endpoint is known)
-    try:
-        trigger_photon_reward(node_id, job_id)
-    except Exception as e:
-        print("Photon trigger failed:", e)
+async def task_worker(stop: asyncio.Event):
+    """Run post-job tasks from the tasks table until `stop` is set; failures are retried with backoff"""
+    while not stop.is_set():
+        try:
+            task = await claim_task()
+        except Exception as e:
+            print("Claiming post-job task failed:", e)
+            task = None
+        if task is None:
+            app.state.task_available.clear()
+            try:
+                await asyncio.wait_for(app.state.task_available.wait(), TASK_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        task_id, task_type, payload, attempts = task
+        try:
+            await run_task(task_id, task_type, orjson.loads(payload))
+            status, next_run, error = "done", now_ts(), None
+        except Exception as e:
+            print(f"Post-job task {task_type} #{task_id} failed (attempt {attempts}):", e)
+            # Shelby client errors won't succeed on retry; unconfirmed payments must not be resent
+            retryable = not isinstance(e, TaskNotRetryable) and not (
+                isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500)
+            status = "pending" if retryable and attempts < TASK_MAX_ATTEMPTS else "failed"
+            next_run, error = now_ts() + 2 ** attempts, str(e)
+        try:
+            async with db_write() as db:
+                await db.execute("UPDATE tasks SET status = ?, next_run = ?, last_error = ? WHERE id = ?",
+                                 (status, next_run, error, task_id))
+        except Exception as e:
+            # the lease expires and the task is retried
+            print(f"Updating post-job task #{task_id} failed:", e)
 
-    print(f"Post-job actions completed for {job_id}: cost={locals().get('cost')}, tx={locals().get('tx')}")
+async def run_task(task_id: int, task_type: str, payload: Dict[str, Any]):
+    if task_type == "shelby_write":
+        await write_to_shelby(payload["record"])
+    elif task_type == "aptos_payment":
+        await pay_for_job(task_id, payload["jobId"], payload["nodeId"], payload["cost"])
+    elif task_type == "photon_reward":
+        trigger_photon_reward(payload["nodeId"], payload["jobId"])
+    else:
+        raise ValueError(f"unknown task type {task_type!r}")
 
 # --- Helpers for actions ---
-def write_to_shelby(record: Dict[str, Any]):
+async def pay_for_job(task_id: int, job_id: str, node_id: str, cost: float):
+    """
+    Send the payment for an aptos_payment task at most once. The payments row is written before the transfer, and the tx hash
+    is stored before the task is marked done, so a re-run task (expired lease, lost status update)
+    finds the row and never pays twice.
+    """
+    if not (APTOS_SENDER_ADDRESS and APTOS_PRIVATE_KEY):
+        print("Aptos credentials not configured; skipping on-chain payment. Implement execute_aptos_payment() to send real txs.")
+        print(f"Payment processed for {job_id}: cost={cost}, tx=None")
+        return
+    async with db_write() as db:
+        async with db.execute("INSERT OR IGNORE INTO payments (task_id, job_id, node_id, amount, created_at) VALUES (?, ?, ?, ?, ?)",
+                              (task_id, job_id, node_id, cost, now_ts())) as c:
+            claimed = c.rowcount == 1
+        if not claimed:
+            async with db.execute("SELECT tx_hash FROM payments WHERE task_id = ?", (task_id,)) as c:
+                tx, = await c.fetchone()
+    if not claimed:
+        if tx:
+            print(f"Payment for {job_id} already sent (tx={tx}); skipping")
+            return
+        raise TaskNotRetryable(f"payment for {job_id} was started but never confirmed; reconcile before resending")
+    try:
+        tx = execute_aptos_payment(node_id, cost)
+    except Exception as e:
+        # the transfer may or may not have gone out
+        raise TaskNotRetryable(f"payment for {job_id} failed and may have been sent: {e}") from e
+    async with db_write() as db:
+        await db.execute("UPDATE payments SET tx_hash = ? WHERE task_id = ?", (tx, task_id))
+    print(f"Payment processed for {job_id}: cost={cost}, tx={tx}")
+
+async def write_to_shelby(record: Dict[str, Any]):
     payload = {"record": record}
-    headers = {"Authorization": f"Bearer {SHELBY_API_KEY}", "Content-Type": "application/json"}
-    res = requests.post(SHELBY_API_URL, json=payload, headers=headers, timeout=10)
+    res = await app.state.http.post(SHELBY_API_URL, content=orjson.dumps(payload), headers=SHELBY_HEADERS)
     res.raise_for_status()
     print("Wrote provenance to Shelby")
 
-def calculate_cost_for_job(job_id: str) -> float:
+def calculate_cost(started_at: Optional[int], finished_at: Optional[int]) -> float:
     # very simple pricing: $0.05 per minute
-    conn = db_connect()
-    c = conn.cursor()
-    c.execute("SELECT started_at, finished_at FROM jobs WHERE job_id = ?", (job_id,))
-    r = c.fetchone()
-    conn.close()
-    if not r or not r[0] or not r[1]:
+    if not started_at or not finished_at:
         return 0.0
-    duration_minutes = max(1, int((r[1] - r[0]) / 60))
+    duration_minutes = max(1, int((finished_at - started_at) / 60))
     price_per_min = 0.05
     usd_cost = duration_minutes * price_per_min
     # convert to Aptos units if desired later
@@ -440,8 +956,8 @@ def calculate_cost_for_job(job_id: str) -> float:
 def execute_aptos_payment(node_id: str, amount_usd: float) -> Optional[str]:
     # Placeholder: integrate real Aptos SDK here.
     # Suggestion: use aptos-python-client or REST API — sign tx with APTOS_PRIVATE_KEY and send funds
-    # For now, return a deterministic dummy tx hash so frontend can display something
-    dummy = hashlib.sha256(f"{node_id}:{amount_usd}:{time.time()}".encode()).hexdigest()
+    # For now, return a random 32-byte dummy tx hash so frontend can display something
+    dummy = secrets.token_hex(32)
     print("(Placeholder) Aptos tx hash:", dummy)
     return dummy
 
@@ -452,24 +968,18 @@ def trigger_photon_reward(node_id: str, job_id: str):
 
 # --- Frontend API endpoints ---
 @app.get("/api/frontend/system-stats")
-def get_system_stats():
+@cached_response(STATS_CACHE_TTL)
+async def get_system_stats():
     """Get overall system statistics for frontend dashboard"""
-    conn = db_connect()
-    c = conn.cursor()
-    
-    # Count jobs by status
-    c.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
-    status_counts = dict(c.fetchall())
-    
-    # Get total jobs
-    c.execute("SELECT COUNT(*) FROM jobs")
-    total_jobs = c.fetchone()[0]
-    
-    # Get active nodes
-    c.execute("SELECT COUNT(*) FROM nodes WHERE last_seen > ?", (now_ts() - 300,))  # last 5 mins
-    active_nodes = c.fetchone()[0]
-    
-    conn.close()
+    async with db_read() as db:
+        # Count jobs by status (index-only scan of idx_jobs_status_created); the total is their sum
+        async with db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status") as c:
+            status_counts = dict(await c.fetchall())
+
+        # Get active nodes
+        async with db.execute("SELECT COUNT(*) FROM nodes WHERE last_seen > ?", (now_ts() - 300,)) as c:  # last 5 mins
+            active_nodes = (await c.fetchone())[0]
+    total_jobs = sum(status_counts.values())
     
     return {
         "activeJobs": status_counts.get("assigned", 0) + status_counts.get("running", 0),
@@ -483,20 +993,18 @@ def get_system_stats():
 
 
 @app.get("/api/frontend/node-stats")
-def get_node_stats():
+@cached_response(STATS_CACHE_TTL)
+async def get_node_stats():
     """Get aggregated node statistics"""
-    conn = db_connect()
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM nodes")
-    total_nodes = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM nodes WHERE last_seen > ?", (now_ts() - 300,))
-    online_nodes = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('assigned', 'running')")
-    active_jobs = c.fetchone()[0]
-    
-    conn.close()
+    async with db_read() as db:
+        async with db.execute("SELECT COUNT(*) FROM nodes") as c:
+            total_nodes = (await c.fetchone())[0]
+
+        async with db.execute("SELECT COUNT(*) FROM nodes WHERE last_seen > ?", (now_ts() - 300,)) as c:
+            online_nodes = (await c.fetchone())[0]
+
+        async with db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('assigned', 'running')") as c:
+            active_jobs = (await c.fetchone())[0]
     
     return {
         "total": total_nodes,
@@ -507,18 +1015,15 @@ def get_node_stats():
     }
 
 @app.get("/api/frontend/logs")
-def get_logs_for_frontend(jobId: str = None, limit: int = 100):
+async def get_logs_for_frontend(jobId: str = None, limit: int = 100):
     """Get logs for frontend, optionally filtered by job ID"""
-    conn = db_connect()
-    c = conn.cursor()
-    
     if jobId:
-        c.execute("SELECT job_id, line, ts FROM logs WHERE job_id = ? ORDER BY id DESC LIMIT ?", (jobId, limit))
+        query = ("SELECT job_id, line, ts FROM logs WHERE job_id = ? ORDER BY id DESC LIMIT ?", (jobId, limit))
     else:
-        c.execute("SELECT job_id, line, ts FROM logs ORDER BY id DESC LIMIT ?", (limit,))
+        query = ("SELECT job_id, line, ts FROM logs ORDER BY id DESC LIMIT ?", (limit,))
     
-    rows = c.fetchall()
-    conn.close()
+    async with db_read() as db, db.execute(*query) as c:
+        rows = await c.fetchall()
     
     return [{
         "jobId": r[0],
@@ -527,20 +1032,16 @@ def get_logs_for_frontend(jobId: str = None, limit: int = 100):
     } for r in rows]
 
 @app.get("/api/frontend/job-metrics/{job_id}")
-def get_job_metrics(job_id: str):
+async def get_job_metrics(job_id: str):
     """Get metrics for a specific job"""
-    conn = db_connect()
-    c = conn.cursor()
-    
-    # Get job duration
-    c.execute("SELECT started_at, finished_at FROM jobs WHERE job_id = ?", (job_id,))
-    job_times = c.fetchone()
-    
-    # Get usage reports (stored as JSON in logs)
-    c.execute("SELECT line, ts FROM logs WHERE job_id = ? ORDER BY id", (job_id,))
-    log_rows = c.fetchall()
-    
-    conn.close()
+    async with db_read() as db:
+        # Get job duration
+        async with db.execute("SELECT started_at, finished_at FROM jobs WHERE job_id = ?", (job_id,)) as c:
+            job_times = await c.fetchone()
+        
+        # Get usage reports (stored as JSON in logs)
+        async with db.execute("SELECT line, ts FROM logs WHERE job_id = ? ORDER BY id", (job_id,)) as c:
+            log_rows = await c.fetchall()
     
     duration = 0
     gpu_usage = []
@@ -554,7 +1055,7 @@ def get_job_metrics(job_id: str):
     # Parse usage metrics from logs
     for line, ts in log_rows:
         try:
-            data = json.loads(line)
+            data = orjson.loads(line)
             if "cpu" in data and "ram" in data:
                 cpu_usage.append(data["cpu"])
                 memory_usage.append(data["ram"])
@@ -573,70 +1074,78 @@ def get_job_metrics(job_id: str):
 
 # --- Utilities for debugging ---
 @app.get("/api/debug/jobs")
-def list_jobs():
-    conn = db_connect()
-    c = conn.cursor()
-    c.execute("SELECT job_id, status, payload, assigned_node, started_at, finished_at FROM jobs ORDER BY created_at DESC")
-    rows = c.fetchall()
-    conn.close()
+async def list_jobs(limit: int = 100, offset: int = 0):
+    async with db_read() as db, db.execute("""
+        SELECT job_id, status, dataset_name, dataset_url, dataset_hash, meta, created_at,
+               assigned_node, started_at, finished_at
+        FROM jobs ORDER BY created_at DESC LIMIT ? OFFSET ?
+    """, (limit, offset)) as c:
+        rows = await c.fetchall()
     out = []
     for r in rows:
         out.append({
-            "jobId": r[0],
-            "status": r[1],
-            "payload": json.loads(r[2]) if r[2] else None,
-            "assigned": r[3],
-            "startedAt": r[4],
-            "finishedAt": r[5]
+            "jobId": r["job_id"],
+            "status": r["status"],
+            "payload": {
+                "jobId": r["job_id"],
+                "datasetName": r["dataset_name"],
+                "datasetUrl": r["dataset_url"],
+                "datasetHash": r["dataset_hash"],
+                "meta": orjson.loads(r["meta"]) if r["meta"] else None,
+                "createdAt": r["created_at"]
+            },
+            "assigned": r["assigned_node"],
+            "startedAt": r["started_at"],
+            "finishedAt": r["finished_at"]
         })
     return out
 
 @app.get("/api/debug/logs")
-def dump_logs(limit: int = 200):
-    conn = db_connect()
-    c = conn.cursor()
-    c.execute("SELECT job_id, line, ts FROM logs ORDER BY id DESC LIMIT ?", (limit,))
-    rows = c.fetchall()
-    conn.close()
+async def dump_logs(limit: int = 200, jobId: Optional[str] = None):
+    if jobId:
+        # served by idx_logs_jobid_id (job_id, id DESC)
+        query = ("SELECT job_id, line, ts FROM logs WHERE job_id = ? ORDER BY id DESC LIMIT ?", (jobId, limit))
+    else:
+        query = ("SELECT job_id, line, ts FROM logs ORDER BY id DESC LIMIT ?", (limit,))
+    async with db_read() as db, db.execute(*query) as c:
+        rows = await c.fetchall()
     return [{"jobId": r[0], "line": r[1], "ts": r[2]} for r in rows]
 
 # --- Frontend API Endpoints ---
 
 @app.get("/api/frontend/dashboard")
-def get_dashboard_stats():
+@cached_response(STATS_CACHE_TTL)
+async def get_dashboard_stats():
     """Get dashboard statistics for frontend"""
-    conn = db_connect()
-    c = conn.cursor()
-    
-    # Get job counts by status
-    c.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
-    job_stats = {row[0]: row[1] for row in c.fetchall()}
-    
-    # Get active nodes count
-    cutoff = now_ts() - 60  # nodes active in last minute
-    c.execute("SELECT COUNT(*) FROM nodes WHERE last_seen > ?", (cutoff,))
-    active_nodes = c.fetchone()[0]
-    
-    # Get recent jobs
-    c.execute("""
-        SELECT job_id, status, payload, created_at, assigned_node, started_at, finished_at 
-        FROM jobs ORDER BY created_at DESC LIMIT 10
-    """)
+    ts = now_ts()
+    cutoff = ts - 60  # nodes active in last minute
+    async with db_read() as db:
+        # Get job counts by status
+        async with db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status") as c:
+            job_stats = {row[0]: row[1] for row in await c.fetchall()}
+
+        # Get active nodes count
+        async with db.execute("SELECT COUNT(*) FROM nodes WHERE last_seen > ?", (cutoff,)) as c:
+            active_nodes = (await c.fetchone())[0]
+
+        # Get recent jobs
+        async with db.execute("""
+            SELECT job_id, status, dataset_name, created_at, assigned_node, started_at, finished_at 
+            FROM jobs ORDER BY created_at DESC LIMIT 10
+        """) as c:
+            rows = await c.fetchall()
     recent_jobs = []
-    for row in c.fetchall():
-        payload = json.loads(row[2]) if row[2] else {}
+    for row in rows:
         recent_jobs.append({
             "jobId": row[0],
             "status": row[1],
-            "datasetName": payload.get("datasetName", "Unknown"),
+            "datasetName": row[2] or "Unknown",
             "createdAt": row[3],
             "assignedNode": row[4],
             "startedAt": row[5],
             "finishedAt": row[6]
         })
     
-    conn.close()
-    
     return {
         "jobStats": {
             "pending": job_stats.get("pending", 0),
@@ -646,100 +1155,91 @@ def get_dashboard_stats():
         },
         "activeNodes": active_nodes,
         "recentJobs": recent_jobs,
-        "timestamp": now_ts()
+        "timestamp": ts
     }
 
 @app.get("/api/frontend/jobs")
-def get_jobs_for_frontend(status: Optional[str] = None, limit: int = 50):
+async def get_jobs_for_frontend(status: Optional[str] = None, limit: int = 50):
     """Get jobs with frontend-friendly format"""
-    conn = db_connect()
-    c = conn.cursor()
-    
     if status:
-        c.execute("""
-            SELECT job_id, status, payload, created_at, assigned_node, started_at, finished_at, result
+        query = ("""
+            SELECT job_id, status, dataset_name, created_at, assigned_node, started_at, finished_at, result,
+                   dataset_url, meta
             FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?
         """, (status, limit))
     else:
-        c.execute("""
-            SELECT job_id, status, payload, created_at, assigned_node, started_at, finished_at, result
+        query = ("""
+            SELECT job_id, status, dataset_name, created_at, assigned_node, started_at, finished_at, result,
+                   dataset_url, meta
             FROM jobs ORDER BY created_at DESC LIMIT ?
         """, (limit,))
+    async with db_read() as db, db.execute(*query) as c:
+        rows = await c.fetchall()
     
     jobs = []
-    for row in c.fetchall():
-        payload = json.loads(row[2]) if row[2] else {}
-        result = json.loads(row[7]) if row[7] else {}
+    for row in rows:
+        result = orjson.loads(row["result"]) if row["result"] else {}
         
         # Calculate duration if job is finished
         duration = None
-        if row[5] and row[6]:  # started_at and finished_at
-            duration = row[6] - row[5]
+        if row["started_at"] and row["finished_at"]:
+            duration = row["finished_at"] - row["started_at"]
         
         jobs.append({
-            "jobId": row[0],
-            "status": row[1],
-            "datasetName": payload.get("datasetName", "Unknown"),
-            "datasetUrl": payload.get("datasetUrl"),
-            "meta": payload.get("meta", {}),
-            "createdAt": row[3],
-            "assignedNode": row[4],
-            "startedAt": row[5],
-            "finishedAt": row[6],
+            "jobId": row["job_id"],
+            "status": row["status"],
+            "datasetName": row["dataset_name"] or "Unknown",
+            "datasetUrl": row["dataset_url"],
+            "meta": orjson.loads(row["meta"]) if row["meta"] else {},
+            "createdAt": row["created_at"],
+            "assignedNode": row["assigned_node"],
+            "startedAt": row["started_at"],
+            "finishedAt": row["finished_at"],
             "duration": duration,
             "modelHash": result.get("modelHash") if result else None,
             "metadata": result.get("meta") if result else None
         })
     
-    conn.close()
     return {"jobs": jobs, "count": len(jobs)}
 
 @app.get("/api/frontend/jobs/{job_id}")
-def get_job_details(job_id: str):
+async def get_job_details(job_id: str):
     """Get detailed job information including logs"""
-    conn = db_connect()
-    c = conn.cursor()
-    
-    # Get job info
-    c.execute("""
-        SELECT job_id, status, payload, created_at, assigned_node, started_at, finished_at, result
-        FROM jobs WHERE job_id = ?
-    """, (job_id,))
-    
-    row = c.fetchone()
+    # one statement: the job row plus its logs and provenance, aggregated to JSON arrays inside SQLite
+    async with db_read() as db, db.execute("""
+        SELECT job_id, status, dataset_name, created_at, assigned_node, started_at, finished_at, result,
+               dataset_url, meta,
+               (SELECT json_group_array(json_object('line', line, 'timestamp', ts))
+                FROM (SELECT line, ts FROM logs WHERE job_id = j.job_id ORDER BY id ASC)),
+               (SELECT json_group_array(json_object(
+                           'record', json_object('jobId', job_id, 'nodeId', node_id, 'modelHash', model_hash,
+                                                 'modelHashAlgo', model_hash_algo, 'modelSizeBytes', model_size_bytes,
+                                                 'durationSeconds', duration_seconds, 'metadata', json(metadata),
+                                                 'ts', created_at),
+                           'createdAt', created_at))
+                FROM provenance WHERE job_id = j.job_id)
+        FROM jobs j WHERE job_id = ?
+    """, (job_id,)) as c:
+        row = await c.fetchone()
     if not row:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    payload = json.loads(row[2]) if row[2] else {}
-    result = json.loads(row[7]) if row[7] else {}
+    result = orjson.loads(row[7]) if row[7] else {}
     
     # Calculate duration
     duration = None
     if row[5] and row[6]:  # started_at and finished_at
         duration = row[6] - row[5]
     
-    # Get job logs
-    c.execute("SELECT line, ts FROM logs WHERE job_id = ? ORDER BY id ASC", (job_id,))
-    logs = [{"line": log[0], "timestamp": log[1]} for log in c.fetchall()]
-    
-    # Get provenance records
-    c.execute("SELECT record, created_at FROM provenance WHERE job_id = ?", (job_id,))
-    provenance = []
-    for prov_row in c.fetchall():
-        record = json.loads(prov_row[0]) if prov_row[0] else {}
-        provenance.append({
-            "record": record,
-            "createdAt": prov_row[1]
-        })
-    
-    conn.close()
+    logs = orjson.loads(row[10])
+    provenance = orjson.loads(row[11])
     
     job_details = {
         "jobId": row[0],
         "status": row[1],
-        "datasetName": payload.get("datasetName", "Unknown"),
-        "datasetUrl": payload.get("datasetUrl"),
-        "meta": payload.get("meta", {}),
+        "datasetName": row[2] or "Unknown",
+        "datasetUrl": row[8],
+        "meta": orjson.loads(row[9]) if row[9] else {},
         "createdAt": row[3],
         "assignedNode": row[4],
         "startedAt": row[5],
@@ -754,18 +1254,16 @@ def get_job_details(job_id: str):
     return job_details
 
 @app.get("/api/frontend/nodes")
-def get_nodes_for_frontend():
+async def get_nodes_for_frontend():
     """Get compute nodes with frontend-friendly format"""
-    conn = db_connect()
-    c = conn.cursor()
-    
-    c.execute("SELECT node_id, info, last_seen FROM nodes ORDER BY last_seen DESC")
+    async with db_read() as db, db.execute("SELECT node_id, info, last_seen FROM nodes ORDER BY last_seen DESC") as c:
+        rows = await c.fetchall()
     nodes = []
     current_time = now_ts()
     
-    for row in c.fetchall():
-        info = json.loads(row[1]) if row[1] else {}
-        last_seen = row[2]
+    for row in rows:
+        info = orjson.loads(row["info"]) if row["info"] else {}
+        last_seen = row["last_seen"]
         
         # Determine node status
         if current_time - last_seen < 30:  # active if seen in last 30 seconds
@@ -776,7 +1274,7 @@ def get_nodes_for_frontend():
             status = "offline"
         
         nodes.append({
-            "nodeId": row[0],
+            "nodeId": row["node_id"],
             "status": status,
             "lastSeen": str(last_seen),
             "lastSeenAgo": current_time - last_seen,
@@ -792,37 +1290,28 @@ def get_nodes_for_frontend():
             "region": info.get("region", info.get("os", "Unknown"))
         })
     
-    conn.close()
     return {"nodes": nodes, "count": len(nodes)}
 
 @app.get("/api/frontend/logs/{job_id}")
-def get_job_logs_stream(job_id: str, limit: int = 1000):
+async def get_job_logs_stream(job_id: str, limit: int = 1000):
     """Get streaming logs for a specific job"""
-    conn = db_connect()
-    c = conn.cursor()
-    
-    c.execute("SELECT line, ts FROM logs WHERE job_id = ? ORDER BY id DESC LIMIT ?", (job_id, limit))
-    logs = [{"line": row[0], "timestamp": row[1]} for row in c.fetchall()]
+    async with db_read() as db, db.execute("SELECT line, ts FROM logs WHERE job_id = ? ORDER BY id DESC LIMIT ?", (job_id, limit)) as c:
+        logs = [{"line": row[0], "timestamp": row[1]} for row in await c.fetchall()]
     logs.reverse()  # Show oldest first
     
-    conn.close()
     return {"jobId": job_id, "logs": logs}
 
 @app.delete("/api/frontend/jobs/{job_id}")
-def delete_job(job_id: str):
+async def delete_job(job_id: str):
     """Delete a job and its associated data"""
-    conn = db_connect()
-    c = conn.cursor()
-    
     # Delete job and related records
-    c.execute("DELETE FROM logs WHERE job_id = ?", (job_id,))
-    c.execute("DELETE FROM provenance WHERE job_id = ?", (job_id,))
-    c.execute("DELETE FROM job_scripts WHERE job_id = ?", (job_id,))
-    c.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
-    
-    deleted = c.rowcount > 0
-    conn.commit()
-    conn.close()
+    async with db_write() as db:
+        await db.execute("DELETE FROM logs WHERE job_id = ?", (job_id,))
+        await db.execute("DELETE FROM provenance WHERE job_id = ?", (job_id,))
+        await db.execute("DELETE FROM job_scripts WHERE job_id = ?", (job_id,))
+        async with db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,)) as c:
+            deleted = c.rowcount > 0
+    _script_cache.pop(job_id, None)
     
     if not deleted:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -830,49 +1319,19 @@ def delete_job(job_id: str):
     return {"status": "ok", "message": "Job deleted successfully", "jobId": job_id}
 
 @app.delete("/api/frontend/nodes/{node_id}")
-def delete_node(node_id: str):
+async def delete_node(node_id: str):
     """Delete a compute node"""
-    conn = db_connect()
-    c = conn.cursor()
-    
-    # Check if node has active jobs
-    c.execute("SELECT COUNT(*) FROM jobs WHERE assigned_node = ? AND status IN ('assigned', 'running')", (node_id,))
-    active_jobs = c.fetchone()[0]
-    
-    if active_jobs > 0:
-        conn.close()
-        raise HTTPException(status_code=400, detail=f"Cannot delete node with {active_jobs} active job(s)")
-    
-    # Delete the node
-    c.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
-    deleted = c.rowcount > 0
-    conn.commit()
-    conn.close()
-    
-    if not deleted:
-        raise HTTPException(status_code=404, detail="Node not found")
-    
-    return {"status": "ok", "message": "Node deleted successfully", "nodeId": node_id}
-
-@app.delete("/api/frontend/nodes/{node_id}")
-def delete_node(node_id: str):
-    """Delete a compute node"""
-    conn = db_connect()
-    c = conn.cursor()
-    
-    # Check if node has active jobs
-    c.execute("SELECT COUNT(*) FROM jobs WHERE assigned_node = ? AND status IN ('assigned', 'running')", (node_id,))
-    active_jobs = c.fetchone()[0]
-    
-    if active_jobs > 0:
-        conn.close()
-        raise HTTPException(status_code=400, detail=f"Cannot delete node with {active_jobs} active job(s)")
-    
-    # Delete the node
-    c.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
-    deleted = c.rowcount > 0
-    conn.commit()
-    conn.close()
+    async with db_write() as db:
+        # Check if node has active jobs
+        async with db.execute("SELECT COUNT(*) FROM jobs WHERE assigned_node = ? AND status IN ('assigned', 'running')", (node_id,)) as c:
+            active_jobs = (await c.fetchone())[0]
+        
+        if active_jobs > 0:
+            raise HTTPException(status_code=400, detail=f"Cannot delete node with {active_jobs} active job(s)")
+        
+        # Delete the node
+        async with db.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,)) as c:
+            deleted = c.rowcount > 0
     
     if not deleted:
         raise HTTPException(status_code=404, detail="Node not found")
@@ -880,93 +1339,70 @@ def delete_node(node_id: str):
     return {"status": "ok", "message": "Node deleted successfully", "nodeId": node_id}
 
 @app.post("/api/frontend/jobs/{job_id}/restart")
-def restart_job(job_id: str):
+async def restart_job(job_id: str):
     """Restart a finished or failed job"""
-    conn = db_connect()
-    c = conn.cursor()
-    
     # Reset job status to pending
-    c.execute("""
-        UPDATE jobs SET status = 'pending', assigned_node = NULL, 
-        started_at = NULL, finished_at = NULL, result = NULL 
-        WHERE job_id = ?
-    """, (job_id,))
-    
-    updated = c.rowcount > 0
-    conn.commit()
-    conn.close()
+    async with db_write() as db:
+        async with db.execute("""
+            UPDATE jobs SET status = 'pending', assigned_node = NULL, 
+            started_at = NULL, finished_at = NULL, result = NULL, acked_at = NULL, claimed_at = NULL
+            WHERE job_id = ?
+        """, (job_id,)) as c:
+            updated = c.rowcount > 0
     
     if not updated:
         raise HTTPException(status_code=404, detail="Job not found")
     
+    _wake_pollers()
     return {"status": "ok", "message": "Job restarted successfully", "jobId": job_id}
 
 @app.get("/api/frontend/system/health")
-def system_health():
+@cached_response(STATS_CACHE_TTL)
+async def system_health():
     """Get system health status"""
-    conn = db_connect()
-    c = conn.cursor()
-    
+    # Active nodes and job counts in one round trip; each count is an index range scan
+    # (idx_nodes_lastseen, idx_jobs_status_created). A failing query marks the database unhealthy.
+    ts = now_ts()
+    cutoff = ts - 60
     try:
-        # Test database connection
-        c.execute("SELECT 1")
+        async with db_read() as db, db.execute("""
+            SELECT (SELECT COUNT(*) FROM nodes WHERE last_seen > ?),
+                   (SELECT COUNT(*) FROM jobs WHERE status = 'pending'),
+                   (SELECT COUNT(*) FROM jobs WHERE status = 'assigned'),
+                   (SELECT COUNT(*) FROM jobs WHERE status = 'finished')
+        """, (cutoff,)) as c:
+            active_nodes, pending, running, completed = await c.fetchone()
         db_status = "healthy"
     except Exception:
         db_status = "unhealthy"
-    
-    # Count active nodes
-    cutoff = now_ts() - 60
-    c.execute("SELECT COUNT(*) FROM nodes WHERE last_seen > ?", (cutoff,))
-    active_nodes = c.fetchone()[0]
-    
-    # Count jobs by status
-    c.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
-    job_counts = {row[0]: row[1] for row in c.fetchall()}
-    
-    conn.close()
+        active_nodes = pending = running = completed = 0
     
     return {
         "status": "healthy" if db_status == "healthy" else "unhealthy",
         "database": db_status,
         "activeNodes": active_nodes,
         "jobQueue": {
-            "pending": job_counts.get("pending", 0),
-            "running": job_counts.get("assigned", 0),
-            "completed": job_counts.get("finished", 0)
+            "pending": pending,
+            "running": running,
+            "completed": completed
         },
-        "timestamp": now_ts()
+        "timestamp": ts
     }
 
 @app.get("/api/frontend/earnings/{aptos_public_key}")
-def get_earnings_by_public_key(aptos_public_key: str):
+async def get_earnings_by_public_key(aptos_public_key: str):
     """Get earnings data for a specific Aptos public key"""
-    conn = db_connect()
-    c = conn.cursor()
-    
-    # Get nodes associated with this public key
-    # Note: In real implementation, you'd have a mapping table
-    # For now, we'll mock this by using node specs to store public keys
-    c.execute("SELECT node_id, info FROM nodes")
-    user_nodes = []
-    for row in c.fetchall():
-        info = json.loads(row[1]) if row[1] else {}
-        if info.get('aptosPublicKey') == aptos_public_key:
-            user_nodes.append(row[0])
-    
-    # Calculate earnings from completed jobs
-    if user_nodes:
-        placeholders = ','.join(['?' for _ in user_nodes])
-        c.execute(f"""
-            SELECT COUNT(*) as total_jobs, 
-                   AVG(CASE WHEN finished_at AND started_at THEN finished_at - started_at ELSE NULL END) as avg_duration
-            FROM jobs WHERE assigned_node IN ({placeholders}) AND status = 'finished'
-        """, user_nodes)
-        job_stats = c.fetchone()
-        total_jobs = job_stats[0] if job_stats else 0
-        avg_duration = job_stats[1] if job_stats and job_stats[1] else 0
-    else:
-        total_jobs = 0
-        avg_duration = 0
+    # node count plus finished-job stats for this public key in one aggregate query;
+    # CROSS JOIN keeps nodes outermost, as in payments, so jobs are read per node off idx_jobs_node_status_finished
+    async with db_read() as db, db.execute("""
+        SELECT (SELECT COUNT(*) FROM nodes WHERE aptos_public_key = ?) AS node_count,
+               COUNT(j.job_id) AS total_jobs,
+               AVG(CASE WHEN j.finished_at AND j.started_at THEN j.finished_at - j.started_at ELSE NULL END) AS avg_duration
+        FROM nodes n CROSS JOIN jobs j ON j.assigned_node = n.node_id AND j.status = 'finished'
+        WHERE n.aptos_public_key = ?
+    """, (aptos_public_key, aptos_public_key)) as c:
+        node_count, total_jobs, avg_duration = await c.fetchone()
+    avg_duration = avg_duration or 0
     
     # Mock earnings calculation (in real implementation, fetch from payment records)
     total_earned = total_jobs * 12.5  # Mock: $12.50 per job
@@ -974,68 +1410,112 @@ def get_earnings_by_public_key(aptos_public_key: str):
     weekly_earned = min(total_earned, 284.15)  # Mock weekly earnings
     monthly_earned = min(total_earned, 967.45)  # Mock monthly earnings
     
-    conn.close()
-    
     return {
         "totalEarned": total_earned,
         "todayEarned": today_earned,
         "weeklyEarned": weekly_earned,
         "monthlyEarned": monthly_earned,
         "totalJobs": total_jobs,
-        "activeNodes": len(user_nodes),
+        "activeNodes": node_count,
         "averageJobDuration": avg_duration / 60 if avg_duration else 0,  # Convert to minutes
         "estimatedMonthly": total_earned * 1.2  # Mock growth estimate
     }
 
 @app.get("/api/frontend/payments/{aptos_public_key}")
-def get_payments_by_public_key(aptos_public_key: str, limit: int = 50):
+async def get_payments_by_public_key(aptos_public_key: str, limit: int = 50):
     """Get payment history for a specific Aptos public key"""
-    conn = db_connect()
-    c = conn.cursor()
-    
-    # Get user's nodes
-    c.execute("SELECT node_id, info FROM nodes")
-    user_nodes = []
-    for row in c.fetchall():
-        info = json.loads(row[1]) if row[1] else {}
-        if info.get('aptosPublicKey') == aptos_public_key:
-            user_nodes.append(row[0])
-    
+    # Completed jobs on the user's nodes, newest first, in one join. CROSS JOIN pins nodes as the
+    # outer loop so SQLite walks idx_nodes_aptos then idx_jobs_node_status_finished per node,
+    # instead of scanning every finished job through idx_jobs_status_created.
+    async with db_read() as db, db.execute("""
+        SELECT j.job_id, j.assigned_node, j.started_at, j.finished_at,
+               json_type(j.meta, '$.type'), json_extract(j.meta, '$.type')
+        FROM nodes n CROSS JOIN jobs j ON j.assigned_node = n.node_id
+        WHERE n.aptos_public_key = ? AND j.status = 'finished'
+        ORDER BY j.finished_at DESC LIMIT ?
+    """, (aptos_public_key, limit)) as c:
+        rows = await c.fetchall()
+
     payments = []
-    if user_nodes:
-        # Get completed jobs for user's nodes
-        placeholders = ','.join(['?' for _ in user_nodes])
-        c.execute(f"""
-            SELECT job_id, assigned_node, started_at, finished_at, payload, result 
-            FROM jobs 
-            WHERE assigned_node IN ({placeholders}) AND status = 'finished'
-            ORDER BY finished_at DESC LIMIT ?
-        """, user_nodes + [limit])
+    for job_id, node_id, started_at, finished_at, type_kind, job_type in rows:
+        # same value meta.get('type', 'Training') gave, without decoding the whole meta document
+        if type_kind is None:
+            job_type = 'Training'
+        elif type_kind in ('object', 'array'):
+            job_type = orjson.loads(job_type)
+        elif type_kind in ('true', 'false'):
+            job_type = type_kind == 'true'
+        duration = (finished_at - started_at) / 60 if finished_at and started_at else 0  # minutes
+        
+        # Mock payment calculation
+        amount = duration * 0.25  # Mock: $0.25 per minute
         
-        for row in c.fetchall():
-            job_id, node_id, started_at, finished_at, payload_json, result_json = row
-            payload = json.loads(payload_json) if payload_json else {}
-            duration = (finished_at - started_at) / 60 if finished_at and started_at else 0  # minutes
-            
-            # Mock payment calculation
-            amount = duration * 0.25  # Mock: $0.25 per minute
-            
-            payments.append({
-                "id": f"pay_{job_id[:8]}",
-                "jobId": job_id,
-                "nodeId": node_id,
-                "amount": round(amount, 2),
-                "currency": "PHOTON",
-                "timestamp": finished_at * 1000,  # Convert to milliseconds
-                "status": "completed",
-                "txHash": f"0x{hashlib.sha256(job_id.encode()).hexdigest()[:8]}...{hashlib.sha256(job_id.encode()).hexdigest()[-4:]}",
-                "jobType": payload.get('meta', {}).get('type', 'Training'),
-                "duration": int(duration)
-            })
+        tx_hash = hashlib.sha256(job_id.encode()).hexdigest()
+        payments.append({
+            "id": f"pay_{job_id[:8]}",
+            "jobId": job_id,
+            "nodeId": node_id,
+            "amount": round(amount, 2),
+            "currency": "PHOTON",
+            "timestamp": finished_at * 1000,  # Convert to milliseconds
+            "status": "completed",
+            "txHash": f"0x{tx_hash[:8]}...{tx_hash[-4:]}",
+            "jobType": job_type,
+            "duration": int(duration)
+        })
     
-    conn.close()
     return {"payments": payments, "count": len(payments)}
 
+def reuseport_worker():
+    """One server process with its own SO_REUSEPORT listening socket on BACKEND_HOST:BACKEND_PORT"""
+    import socket
+    import uvicorn
+    sock = socket.socket(socket.AF_INET6 if ":" in BACKEND_HOST else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((BACKEND_HOST, BACKEND_PORT))
+    config = uvicorn.Config(app, loop=UVICORN_LOOP, http=UVICORN_HTTP, backlog=2048)
+    uvicorn.Server(config).run(sockets=[sock])
+
+def serve_reuseport(workers: int):
+    """
+    Run `workers` independent server processes that each listen on the port with SO_REUSEPORT,
+    so the kernel spreads new connections over per-process accept queues instead of having
+    all workers contend on one shared socket (Linux / BSD only)
+    """
+    import multiprocessing
+    import signal
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=reuseport_worker) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    # pass a service manager's SIGTERM on so each worker shuts down gracefully
+    signal.signal(signal.SIGTERM, lambda *_: [p.terminate() for p in procs])
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        # the workers received the same SIGINT and are shutting down gracefully
+        for p in procs:
+            p.join()
+
 if __name__ == "__main__":
+    import argparse
+    import socket
     import uvicorn
-    uvicorn.run(app, host=BACKEND_HOST, port=BACKEND_PORT)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="ShelbyCompute backend")
+    parser.add_argument("--workers", type=int, default=BACKEND_WORKERS,
+                        help="uvicorn worker processes (default: SC_WORKERS or the CPU count)")
+    parser.add_argument("--reuseport", action="store_true", default=BACKEND_REUSEPORT,
+                        help="give each worker its own SO_REUSEPORT socket (default: SC_REUSEPORT=1)")
+    args = parser.parse_args()
+    if args.reuseport and args.workers > 1 and hasattr(socket, "SO_REUSEPORT"):
+        serve_reuseport(args.workers)
+    elif args.workers > 1:
+        # workers need an import string; each process builds its own DB connections,
+        # log queue and long-poll event in lifespan()
+        uvicorn.run("main:app", host=BACKEND_HOST, port=BACKEND_PORT, workers=args.workers,
+                    loop=UVICORN_LOOP, http=UVICORN_HTTP,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        uvicorn.run(app, host=BACKEND_HOST, port=BACKEND_PORT, loop=UVICORN_LOOP, http=UVICORN_HTTP)
\ No newline at end of file
@@ -5,7 +5,6 @@ Prompts user for configuration and starts the compute node agent
 """
 
 import os
-import re
 import subprocess
 import sys
 from typing import Optional
@@ -25,17 +24,14 @@ def validate_aptos_address(address: str) -> bool:
     # Remove whitespace
     address = address.strip()
     
-    # Check if it starts with 0x and has correct length
-    if not address.startswith('0x'):
+    # 0x followed by exactly 64 hex characters (66 total)
+    if len(address) != 66 or not address.startswith('0x'):
         return False
-    
-    # Should be 66 characters total (0x + 64 hex chars)
-    if len(address) != 66:
+    try:
+        # fromhex skips spaces between byte pairs, so also require all 32 bytes
+        return len(bytes.fromhex(address[2:])) == 32
+    except ValueError:
         return False
-    
-    # Check if remaining characters are valid hex
-    hex_part = address[2:]
-    return re.match(r'^[0-9a-fA-F]+$', hex_part) is not None
 
 def get_aptos_public_key() -> Optional[str]:
     """Prompt user for Aptos public key with validation"""
@@ -125,7 +121,18 @@ def start_agent(aptos_key: Optional[str], backend_url: str, poll_interval: int,
     env['BACKEND_URL'] = backend_url
     env['POLL_INTERVAL'] = str(poll_interval)
     env['HEARTBEAT_INTERVAL'] = str(heartbeat_interval)
-    
+
+    if not os.path.isfile('agent.py'):
+        print("\n❌ agent.py not found in current directory")
+        print("Please make sure you're running this from the provider-agent folder.")
+        return
+
+    if os.name != 'nt':
+        # Replace this setup interpreter with the agent instead of keeping it alive to wait on a child
+        # (Windows has no real exec, so it keeps the subprocess path below)
+        sys.stdout.flush()
+        os.execvpe(sys.executable, [sys.executable, 'agent.py'], env)
+
     try:
         # Start the agent
         subprocess.run([sys.executable, 'agent.py'], env=env, check=True)
@@ -5,17 +5,20 @@ import json
 print("Starting demo training job...")
 print("Job ID: test-script-job")
 
-# Simulate some training work
+# Simulate some training work (DEMO_EPOCH_SLEEP=0 skips the wait)
+epoch_sleep = float(os.environ.get("DEMO_EPOCH_SLEEP", "1"))
 for i in range(5):
     print(f"Training epoch {i+1}/5...")
-    time.sleep(1)  # Reduced for faster testing
+    if epoch_sleep:
+        time.sleep(epoch_sleep)
 
 # Create output directory and save a demo model
 os.makedirs("output", exist_ok=True)
 model_data = f"demo-model-test-script-job-{int(time.time())}"
 
-with open("output/model.bin", "w") as f:
-    f.write(model_data)
+# model files are raw bytes: write in binary mode, no text encoding or newline translation
+with open("output/model.bin", "wb") as f:
+    f.write(model_data.encode())
 
 print("Training completed! Model saved to output/model.bin")
 print(f"Model data: {model_data}")
\ No newline at end of file